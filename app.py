@@ -1,26 +1,32 @@
 import time
 import random
+import threading
 import streamlit as st
-from pathlib import Path
 from mood_logic import (
     recsupport,
     support_options,
     guided_next_page,
     guided_prompt,
     word_to_mode,
+    MOOD_GRID,
 )
 from daily import (
     load_checkins,
     save_checkins,
     upsert_today_checkin,
+    build_checkin_stats,
     renderstreak_card,
 )
-from dashboard import render_dashboard
+from dashboard import render_dashboard, render_perf_page
 from wallet import (
-    load_wallets, save_wallets, get_user_wallet,
-    maybe_award_daily_coins, can_spend, spend, add_reputation
+    load_wallets, get_user_wallet,
+    maybe_award_daily_coins, spend, add_reputation
 )
-from game import render_connect4_page
+from game import render_connect4_page, replay_game_op, snapshot_game
+from board import Board, FEEDS
+from events import VersionBus
+from backend import make_backend
+import profiler
 
 
 # ==============================
@@ -28,22 +34,80 @@ from game import render_connect4_page
 # ==============================
 @st.cache_resource
 def shared_state():
-    return {
-        "chat": [],
+    # the backend (QB_BACKEND, see backend.py) logs every change: board +
+    # matches survive restarts, and with "sqlite" several server processes
+    # share one state (chat, board, lobby, matches)
+    backend = make_backend()
+    SHARED = {
+        "chat": backend.chat,  # bounded live window + archive
         "study": [],
-        "bulletins": [],
-        "replies": {},
+        "board": Board(log=backend.append),  # community posts + replies, with a search index
 
         # NEW: connect four
-        "lobby": [],
-        "matches": [],
+        "lobby": {},
+        "matches": {},       # match_id -> match
         "match_of": {},
         "games": {},
+        "match_ended": {},   # match_id -> end time, archived after a grace period
+        "events": VersionBus(),  # change versions per topic (lobby, match:<id>)
+        "backend": backend,      # locks, op log, presence (see backend.py, locks.py)
     }
+    restore_shared(SHARED)
+    return SHARED
+
+
+def apply_op(SHARED: dict, op: dict):
+    if op["op"] in ("post", "reply"):
+        SHARED["board"].replay(op)
+    else:
+        replay_game_op(SHARED, op)
+
+
+@profiler.timed("restore_shared")
+def restore_shared(SHARED: dict):
+    # latest snapshot, then only the ops logged after it
+    backend = SHARED["backend"]
+    state, tail = backend.load()
+    if state:
+        SHARED["board"].restore(state.get("board", {}))
+        for op in state.get("game", state.get("matches", ())):  # "matches": older snapshots
+            replay_game_op(SHARED, op)
+    for op in tail:
+        apply_op(SHARED, op)
+    backend.set_applier(lambda op: apply_op(SHARED, op))  # ops from other server processes
+    SHARED["board"].index_restored()  # search index fills in on a background thread
+
+
+def maybe_snapshot(SHARED: dict):
+    # cheap check every rerun; the snapshot is written on a background thread
+    backend = SHARED["backend"]
+    if not backend.snapshot_due():
+        return
+    lsn = backend.begin_snapshot()
+    if lsn is None:
+        return
+    state = {"board": SHARED["board"].snapshot(), "game": snapshot_game(SHARED)}
+    threading.Thread(target=backend.write_snapshot, args=(lsn, state), daemon=True).start()
+
+
+# per-rerun timings (QB_PROFILE=1, see profiler.py); the page is the one
+# selected before this rerun until the nav radio below confirms it
+rerun_t0 = profiler.start()
+if profiler.ENABLED:
+    profiler.PROFILER.begin(st.session_state.get("nav"))
 
 SHARED = shared_state()
+SHARED["backend"].sync()  # catch up with other server processes (no-op in memory)
+maybe_snapshot(SHARED)
+
+
+@st.cache_resource
+def shared_wallets():
+    # one ledger per server process; every session reads and writes through it
+    return load_wallets()
 
-CHECKINS_PATH = Path("checkins.json")
+WALLETS = shared_wallets()
+SHARED["board"].follow_wallets(WALLETS)  # reply order tracks reputation changes
 
 
 
@@ -51,9 +115,6 @@ CHECKINS_PATH = Path("checkins.json")
 # ==============================
 # PRIVATE SESSION (PER USER)
 # ==============================
-if "wallets" not in st.session_state:
-    st.session_state.wallets = load_wallets()
-
 if "pending_nav" not in st.session_state:
     st.session_state.pending_nav = None
 
@@ -69,7 +130,11 @@ if "moods" not in st.session_state:
     st.session_state.moods = []  # stores backend 4-category moods
 
 if "checkins" not in st.session_state:
-    st.session_state.checkins = load_checkins()
+    st.session_state.checkins = load_checkins(st.session_state.name)
+
+if "checkin_stats" not in st.session_state:
+    # streak state etc., kept up to date by upsert_today_checkin
+    st.session_state.checkin_stats = build_checkin_stats(st.session_state.checkins)
 
 
 if "reflections" not in st.session_state:
@@ -204,8 +269,10 @@ small, .stCaption {
 )
 
 st.title("QuietBridge")
-def display_name(user: str) -> str:
-    w = get_user_wallet(st.session_state.wallets, user)
+def display_name(user: str, w=None) -> str:
+    # pass w when the caller already holds this user's wallet view
+    if w is None:
+        w = get_user_wallet(WALLETS, user)
 
     rep = int(w.get("reputation", 0))
     trophies = int(w.get("trophies", 0))
@@ -224,6 +291,16 @@ PAGES = [
     "🎮 Connect Four",
     "🫧 Reflection",
 ]
+PERF_PAGE = "🛠️ Performance"  # admin page: profiling on and this session unlocked it
+
+# ?admin=<QB_ADMIN_KEY> unlocks it for this session; the key is then
+# dropped from the address bar
+if "admin" in st.query_params:
+    if profiler.is_admin_key(st.query_params["admin"]):
+        st.session_state.is_admin = True
+    del st.query_params["admin"]
+if profiler.ENABLED and st.session_state.get("is_admin"):
+    PAGES.append(PERF_PAGE)
 
 
 
@@ -238,11 +315,13 @@ if st.session_state.pending_nav in PAGES:
 
 # 3) Keyed widget remembers selection across reruns
 page = st.sidebar.radio("Navigate", PAGES, key="nav")
-w = get_user_wallet(st.session_state.wallets, st.session_state.name)
+if profiler.ENABLED:
+    profiler.PROFILER.set_page(page)
+w = get_user_wallet(WALLETS, st.session_state.name)
 st.sidebar.markdown("---")
 st.sidebar.write(f"🪙 Coins: **{w['coins']}**")
 today_iso = time.strftime("%Y-%m-%d")
-checked_today = any(c.get("date") == today_iso for c in st.session_state.checkins)
+checked_today = bool(st.session_state.checkins) and st.session_state.checkins[-1].get("date") == today_iso
 st.sidebar.caption("🔥 1-day streak → +1 coin")
 st.sidebar.caption("🔥🔥 3-day streak → +2 coins")
 st.sidebar.caption("🔥🔥🔥 5-day streak → +3 coins")
@@ -261,6 +340,8 @@ st.sidebar.write(f"🏆 Trophies: **{w.get('trophies', 0)}**")
 # clear pending nav after it's applied
 st.session_state.pending_nav = None
 
+page_t0 = profiler.start()
+
 # ==============================
 # HOME
 # ==============================
@@ -274,12 +355,7 @@ if page == "🏠 Home":
         st.session_state.selected_word = word
         st.session_state.selected_mode = word  # use the word directly
 
-    mood_grid = [
-        ["Excited", "Joyful", "Motivated", "Inspired"],
-        ["Tense",   "Alert",  "Engaged",   "Proud"],
-        ["Sad",     "Calm",   "Content",   "Peaceful"],
-        ["Drained", "Tired",  "Restful",   "Serene"],
-    ]
+    mood_grid = MOOD_GRID
 
     st.markdown("#### Mood meter")
 
@@ -372,16 +448,17 @@ if page == "🏠 Home":
                 st.session_state.checkins,
                 word=st.session_state.selected_word,
                 mode=st.session_state.selected_mode,
+                stats=st.session_state.checkin_stats,
             )
-            save_checkins(st.session_state.checkins)
+            save_checkins(st.session_state.name, st.session_state.checkins)
             st.toast("Check-in saved. Proud of you.", icon="✅")
 
             earned = maybe_award_daily_coins(
-                st.session_state.wallets,
+                WALLETS,
                 st.session_state.name,
                 st.session_state.checkins,
+                streak_state=st.session_state.checkin_stats["streaks"],
             )
-            save_wallets(st.session_state.wallets)
 
             if earned > 0:
                 st.toast(f"+{earned} coin(s) earned from your streak.", icon="🪙")
@@ -402,8 +479,9 @@ if page == "🏠 Home":
 
         # Pull streak context
         today_iso = time.strftime("%Y-%m-%d")
-        checked_today = any(
-            c.get("date") == today_iso for c in st.session_state.checkins
+        checked_today = (
+            bool(st.session_state.checkins)
+            and st.session_state.checkins[-1].get("date") == today_iso
         )
 
         if checked_today:
@@ -442,7 +520,11 @@ if page == "🏠 Home":
         # ------------------
         # Streak card
         # ------------------
-        renderstreak_card(st.session_state.checkins, st.session_state.moods)
+        renderstreak_card(
+            st.session_state.checkins,
+            st.session_state.moods,
+            stats=st.session_state.checkin_stats,
+        )
 
 
         # ------------------
@@ -451,7 +533,8 @@ if page == "🏠 Home":
         with st.expander("⚙️ Streak settings"):
             if st.button("Reset streak data (demo)", type="secondary"):
                 st.session_state.checkins = []
-                save_checkins([])
+                st.session_state.checkin_stats = build_checkin_stats([])
+                save_checkins(st.session_state.name, [])
                 st.success("Streak data cleared.")
                 st.rerun()
 
@@ -470,9 +553,62 @@ elif page == "💬 Chatroom":
 
     st.caption("Short, low-pressure messages.")
 
-    for m in SHARED["chat"][-20:]:
+    chat = SHARED["chat"]
+    CHAT_PAGE = 20
+    CHAT_GAP = 100
+
+    # scrollback: older pages are fetched by cursor (a message seq) and
+    # kept in this session only; None = just follow the newest messages
+    if "chat_older" not in st.session_state:
+        st.session_state.chat_older = []
+        st.session_state.chat_cursor = None
+        st.session_state.chat_anchor = None
+    if "chat_span" not in st.session_state:
+        st.session_state.chat_span = CHAT_GAP  # messages after the anchor shown
+
+    # the newest messages always show (own sends included); while scrolled
+    # back, the messages after the anchor are paged in between, CHAT_GAP at
+    # a time, and the count still hidden is shown, never silently dropped
+    recent = chat.latest(CHAT_PAGE)
+    between, skipped = [], 0
+    anchor = st.session_state.chat_anchor
+    if anchor is not None:
+        tail_first = recent[0]["seq"] if recent else len(chat)
+        between = [m for m in chat.since(anchor, limit=st.session_state.chat_span) if m["seq"] < tail_first]
+        skipped = tail_first - (between[-1]["seq"] + 1 if between else anchor)
+
+    first_seq = (st.session_state.chat_older or between or recent or [{"seq": 0}])[0]["seq"]
+    if first_seq > 0:
+        if st.button("⬆️ Load older messages"):
+            if st.session_state.chat_anchor is None:
+                st.session_state.chat_anchor = first_seq
+                st.session_state.chat_cursor = first_seq
+            older, st.session_state.chat_cursor = chat.page(
+                before=st.session_state.chat_cursor, limit=CHAT_PAGE
+            )
+            st.session_state.chat_older = older + st.session_state.chat_older
+            st.rerun()
+    elif st.session_state.chat_older:
+        st.caption("That's the beginning of the chat.")
+
+    for m in st.session_state.chat_older + between:
+        st.write(f"**{display_name(m['u'])}**: {m['t']}")
+    if skipped > 0:
+        st.caption(f"⋯ {skipped} newer message{'s' if skipped != 1 else ''} not shown ⋯")
+        if st.button(f"⬇️ Show {min(skipped, CHAT_GAP)} more"):
+            st.session_state.chat_span += CHAT_GAP
+            st.rerun()
+    for m in recent:
         st.write(f"**{display_name(m['u'])}**: {m['t']}")
 
+    if st.session_state.chat_anchor is not None:
+        if st.button("⬇️ Back to latest"):
+            st.session_state.chat_older = []
+            st.session_state.chat_cursor = None
+            st.session_state.chat_anchor = None
+            st.session_state.chat_span = CHAT_GAP
+            st.rerun()
+
 
     msg = st.text_input("Message", placeholder="Type something gentle")
 
@@ -493,7 +629,7 @@ elif page == "💬 Chatroom":
 # ==============================
 elif page == "🎮 Connect Four":
 
-    render_connect4_page(SHARED, st.session_state.name, display_name)
+    render_connect4_page(SHARED, WALLETS, st.session_state.name, display_name)
 
 # ==============================
 # REFLECTION
@@ -563,13 +699,15 @@ elif page == "📌 Community Query":
             if not title.strip() or not body.strip():
                 st.warning("Please fill in both title and details.")
 
-            elif not can_spend(
-                st.session_state.wallets,
+            # spend() checks and debits in one ledger transaction, so two
+            # tabs can't both pass a balance check and overdraw
+            elif not spend(
+                WALLETS,
                 st.session_state.name,
                 POST_COST,
             ):
                 w = get_user_wallet(
-                    st.session_state.wallets,
+                    WALLETS,
                     st.session_state.name,
                 )
                 st.error(
@@ -577,27 +715,12 @@ elif page == "📌 Community Query":
                 )
 
             else:
-                spend(
-                    st.session_state.wallets,
-                    st.session_state.name,
-                    POST_COST,
-                )
-                save_wallets(st.session_state.wallets)
-
-                post_id = f"p_{int(time.time() * 1000)}_{random.randint(1000, 9999)}"
-
-                SHARED["bulletins"].append(
-                    {
-                        "id": post_id,
-                        "title": title.strip(),
-                        "body": body.strip(),
-                        "author": None if post_anon else st.session_state.name,
-                        "time": time.time(),
-                    }
+                SHARED["board"].add_post(
+                    title.strip(),
+                    body.strip(),
+                    None if post_anon else st.session_state.name,
                 )
 
-                SHARED["replies"].setdefault(post_id, [])
-
                 st.success("Posted.")
                 st.rerun()
 
@@ -606,45 +729,64 @@ elif page == "📌 Community Query":
     # --------------------------
     # VIEW POSTS + REPLIES
     # --------------------------
-    posts = list(reversed(SHARED["bulletins"]))  # newest first
-    if not posts:
+    board_t0 = profiler.start()
+    board = SHARED["board"]
+    if not len(board):
         st.info("No posts yet. Be the first to start the board.")
     else:
+        BOARD_PAGE = 10
+        FEED_LABELS = {
+            "newest": "🆕 Newest",
+            "unanswered": "🙋 Unanswered",
+            "most_replies": "💬 Most replies",
+            "active": "⏱️ Recently active",
+        }
+
+        # paging: cursors of the pages visited in this feed (last = current page)
+        if "board_cursors" not in st.session_state:
+            st.session_state.board_cursors = [None]
+
         q = st.text_input("Search posts", placeholder="Type keywords…")
+        next_cursor = None
         if q.strip():
-            ql = q.strip().lower()
-            posts = [
-                p
-                for p in posts
-                if ql in p["title"].lower() or ql in p["body"].lower()
-            ]
-
-        for p in posts[:30]:
+            posts = board.search(q, limit=30)  # ranked, via the inverted index
+            if not board.index_ready:
+                st.caption("Search is still catching up after a restart; older posts may be missing.")
+            elif not posts:
+                st.caption("No posts match every word.")
+        else:
+            feed = st.radio(
+                "Show",
+                FEEDS,
+                format_func=FEED_LABELS.get,
+                horizontal=True,
+                key="board_feed",
+                on_change=lambda: st.session_state.update(board_cursors=[None]),
+            )
+            posts, next_cursor = board.feed(
+                feed, st.session_state.board_cursors[-1], limit=BOARD_PAGE
+            )
+            if not posts:
+                st.caption("Nothing here right now.")
+
+        for p in posts:
                 author_label = "Anonymous" if p["author"] is None else display_name(p["author"])
                 st.caption(f"Posted by **{author_label}**")
 
                 st.write(p["body"])
 
-                replies = SHARED["replies"].get(p["id"], [])
-
-# sort by reputation (descending)
-                replies = sorted(
-                    replies,
-                    key=lambda r: get_user_wallet(
-                        st.session_state.wallets,
-                        r.get("author"),
-                    ).get("reputation", 0)
-                    if r.get("author")
-                    else 0,
-                    reverse=True,
-                )          
+                # highest reputation first, kept in order by the board itself
+                replies = board.top_replies(p["id"], k=10)
 
                 if replies:
                     st.write("**Replies:**")
-                    for r in replies[-10:]:
+                    for r, author_wallet in replies:
                         reply_author = r.get("author")
-                        tag = display_name(reply_author) if reply_author else "Anonymous"
+                        tag = display_name(reply_author, author_wallet) if reply_author else "Anonymous"
                         st.write(f"• **{tag}**: {r['text']}")
+                    n_replies = board.reply_count(p["id"])
+                    if n_replies > len(replies):
+                        st.caption(f"+{n_replies - len(replies)} more")
 
                 else:
                     st.caption("No replies yet.")
@@ -672,13 +814,13 @@ elif page == "📌 Community Query":
                     if not reply_text.strip():
                         st.warning("Write a reply first.")
 
-                    elif not can_spend(
-                        st.session_state.wallets,
+                    elif not spend(
+                        WALLETS,
                         st.session_state.name,
                         REPLY_COST,
                     ):
                         w = get_user_wallet(
-                            st.session_state.wallets,
+                            WALLETS,
                             st.session_state.name,
                         )
                         st.error(
@@ -686,31 +828,16 @@ elif page == "📌 Community Query":
                         )
 
                     else:
-                        spend(
-                            st.session_state.wallets,
-                            st.session_state.name,
-                            REPLY_COST,
-                        )
-
                         add_reputation(
-                            st.session_state.wallets,
+                            WALLETS,
                             st.session_state.name,
                             REPUTATION_PER_REPLY,
                         )
 
-                        
-
-                        save_wallets(st.session_state.wallets)
-
-                        rep_id = f"r_{int(time.time() * 1000)}_{random.randint(1000, 9999)}"
-
-                        SHARED["replies"].setdefault(p["id"], []).append(
-                            {
-                                "id": rep_id,
-                                "text": reply_text.strip(),
-                                "author": st.session_state.name,
-                                "time": time.time(),
-                            }
+                        board.add_reply(
+                            p["id"],
+                            reply_text.strip(),
+                            st.session_state.name,
                         )
 
                         st.toast(
@@ -723,11 +850,42 @@ elif page == "📌 Community Query":
 
                 st.divider()
 
+        if not q.strip():
+            nav_prev, nav_next = st.columns(2)
+            with nav_prev:
+                if len(st.session_state.board_cursors) > 1:
+                    if st.button("⬅️ Previous page", use_container_width=True):
+                        st.session_state.board_cursors.pop()
+                        st.rerun()
+            with nav_next:
+                if next_cursor is not None:
+                    if st.button("Next page ➡️", use_container_width=True):
+                        st.session_state.board_cursors.append(next_cursor)
+                        st.rerun()
+
+    profiler.stop("board", board_t0)
+
 
 # ==============================
 # DASHBOARD
 # ==============================
 elif page == "📋 Dashboard":
 
-    render_dashboard(st.session_state.moods, st.session_state.chat_count, st.session_state.checkins)
+    render_dashboard(
+        st.session_state.moods,
+        st.session_state.chat_count,
+        st.session_state.checkins,
+        user=st.session_state.name,
+        stats=st.session_state.checkin_stats,
+    )
+
+# ==============================
+# PERFORMANCE (ADMIN, QB_PROFILE=1)
+# ==============================
+elif page == PERF_PAGE and st.session_state.get("is_admin"):
+
+    render_perf_page(profiler.PROFILER)
+
 
+profiler.stop("page", page_t0)
+profiler.stop("rerun", rerun_t0)
@@ -0,0 +1,433 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from chatlog import LIVE_CAPACITY, ChatLog
+from journal import SNAPSHOT_EVERY, STATE_DIR, Journal
+from locks import LockTable
+
+# ==============================
+# SHARED-STATE BACKENDS
+# ==============================
+# What sessions share (chat, board, lobby, matches) lives as plain Python
+# state in each server process. A backend decides how far that state is
+# shared and how it is kept:
+#
+#   MemoryBackend   one server process: named in-process locks (locks.py),
+#                   ops go to the on-disk journal (journal.py)
+#   SQLiteBackend   several server processes on one host, e.g. behind a load
+#                   balancer: ops go to one SQLite database in WAL mode and
+#                   every process applies the ops the others wrote, so each
+#                   one holds a replica of the same state
+#
+# Both have the same calls:
+#   append(op)      log an op that has already been applied in this process
+#   sync()          apply ops other processes logged since the last sync
+#   lock(name)      context manager for a check-then-act section
+#   heartbeat(user, now) / last_seen(user) / drop_presence(user)
+#   chat            the chat log (ChatLog API)
+#   load() / snapshot_due() / begin_snapshot() / write_snapshot(lsn, state)
+#
+# Pick one with QB_BACKEND=memory|sqlite (QB_SHARED_DB sets the db path).
+
+BACKEND = os.environ.get("QB_BACKEND", "memory")
+SHARED_DB_PATH = Path(os.environ.get("QB_SHARED_DB", str(STATE_DIR / "shared.db")))
+ACK_EVERY_SECONDS = 5        # how often a process records how far it has applied the log
+REPLICA_TIMEOUT_SECONDS = 60  # a process silent this long stops holding back log trimming
+HEARTBEAT_WRITE_SECONDS = 5  # presence rows are rewritten at most this often (lobby TTL is 30s)
+
+
+def make_backend(kind: str = BACKEND):
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "sqlite":
+        return SQLiteBackend()
+    raise ValueError(f"unknown backend {kind!r} (expected 'memory' or 'sqlite')")
+
+
+class MemoryBackend:
+    """
+    Everything in this process. state_dir=None keeps no journal at all.
+    sync() has nothing to do: no other process writes.
+    """
+
+    multi_process = False
+
+    def __init__(self, state_dir: Path | None = STATE_DIR, chat: ChatLog | None = None):
+        self.journal = Journal(state_dir) if state_dir is not None else None
+        self.chat = chat if chat is not None else ChatLog()
+        self._locks = LockTable()
+        self._seen: dict[str, float] = {}
+
+    def set_applier(self, fn) -> None:
+        pass  # only our own ops ever reach the journal
+
+    # ---------- op stream ----------
+    def append(self, op: dict) -> None:
+        if self.journal is not None:
+            self.journal.append(op)
+
+    def sync(self) -> int:
+        return 0
+
+    # ---------- locks ----------
+    def lock(self, name: str):
+        return self._locks(name)
+
+    def forget_lock(self, name: str) -> None:
+        self._locks.forget(name)
+
+    # ---------- presence ----------
+    def heartbeat(self, user: str, now: float) -> None:
+        self._seen[user] = now
+
+    def last_seen(self, user: str) -> float | None:
+        return self._seen.get(user)
+
+    def drop_presence(self, user: str) -> None:
+        self._seen.pop(user, None)
+
+    # ---------- recovery ----------
+    def load(self) -> tuple[dict | None, list[dict]]:
+        if self.journal is None:
+            return None, []
+        return self.journal.load()
+
+    def snapshot_due(self) -> bool:
+        return self.journal is not None and self.journal.snapshot_due()
+
+    def begin_snapshot(self) -> int | None:
+        return self.journal.begin_snapshot()
+
+    def write_snapshot(self, lsn: int, state: dict) -> None:
+        self.journal.write_snapshot(lsn, state)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ops (
+    lsn    INTEGER PRIMARY KEY AUTOINCREMENT,
+    origin TEXT NOT NULL,
+    op     TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshot (
+    id    INTEGER PRIMARY KEY CHECK (id = 1),
+    lsn   INTEGER NOT NULL,
+    state TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS replicas (
+    origin TEXT PRIMARY KEY,
+    lsn    INTEGER NOT NULL,
+    seen   REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS presence (
+    user TEXT PRIMARY KEY,
+    seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chat (
+    seq INTEGER PRIMARY KEY,
+    msg TEXT NOT NULL
+);
+"""
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        str(path),
+        timeout=10,
+        isolation_level=None,  # we issue BEGIN/COMMIT ourselves
+        check_same_thread=False,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class _Section:
+    # lock(name) for SQLiteBackend: the outermost one per thread holds the
+    # database write lock (BEGIN IMMEDIATE), so sections in different
+    # processes run one at a time, and first catches up with their ops
+    def __init__(self, backend: "SQLiteBackend"):
+        self._b = backend
+
+    def __enter__(self):
+        b = self._b
+        b._rlock.acquire()
+        b._depth += 1
+        if b._depth == 1:
+            try:
+                b._db.execute("BEGIN IMMEDIATE")
+                b._sync()
+            except BaseException:
+                if b._db.in_transaction:
+                    b._db.execute("COMMIT")  # whatever sync applied here is logged already
+                b._depth -= 1
+                b._rlock.release()
+                raise
+        return self
+
+    def __exit__(self, *exc):
+        b = self._b
+        b._depth -= 1
+        try:
+            if b._depth == 0:
+                # commit even when leaving on an exception (st.rerun() is one):
+                # memory was changed before each op was appended
+                b._db.execute("COMMIT")
+        finally:
+            b._rlock.release()
+        return False
+
+
+class SQLiteBackend:
+    """
+    Shared state for several server processes on one host.
+
+    The ops table is the log every process writes and reads. A process
+    applies its own writes in memory first (as with the journal) and
+    applies other processes' ops when it syncs: at the start of each rerun,
+    in the live-update fragment, and on entering lock(). lock() takes the
+    database write lock, so a check-then-act section (matchmaking, a move)
+    sees every earlier section's ops in any process. One process therefore
+    runs one section at a time; lock names only matter to MemoryBackend.
+
+    Lobby heartbeats go to a presence table instead of the log, and chat to
+    a chat table (SQLiteChatLog). Snapshots work as in the journal; ops are
+    trimmed only once every live process has applied them.
+    """
+
+    multi_process = True
+
+    def __init__(self, path: Path = SHARED_DB_PATH, snapshot_every: int = SNAPSHOT_EVERY):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.snapshot_every = snapshot_every
+        self.origin = uuid.uuid4().hex  # marks this process's ops in the shared log
+        self._rlock = threading.RLock()  # one connection shared by session threads
+        self._db = _connect(self.path)
+        self._db.executescript(_SCHEMA)
+        self._depth = 0  # nesting of lock() sections on the thread holding _rlock
+        self._apply = None
+        self.lsn = 0           # every op up to here has been applied in this process
+        self.snapshot_lsn = 0  # last op covered by the newest snapshot we know of
+        self._snapshotting = False
+        self._data_version = None
+        self._acked_at = 0.0
+        self._beats: dict[str, float] = {}  # user -> last presence write from this process
+        self.chat = SQLiteChatLog(self)
+
+    def set_applier(self, fn) -> None:
+        """fn(op) applies one op logged by another process."""
+        self._apply = fn
+
+    # ---------- op stream ----------
+    def append(self, op: dict) -> None:
+        text = json.dumps(op, ensure_ascii=False)
+        with self._rlock:  # inside a lock() section this joins its transaction
+            self._db.execute("INSERT INTO ops (origin, op) VALUES (?, ?)", (self.origin, text))
+
+    def sync(self) -> int:
+        """Apply ops other processes logged since the last sync; returns how many."""
+        with self._rlock:
+            return self._sync()
+
+    def _sync(self) -> int:
+        # caller holds _rlock; data_version only moves on other connections' commits
+        if self._apply is None:
+            return 0  # still loading: ops past the tail wait for the applier
+        dv = self._db.execute("PRAGMA data_version").fetchone()[0]
+        if dv == self._data_version and not self._db.in_transaction:
+            return 0
+        self._data_version = dv
+        rows = self._db.execute(
+            "SELECT lsn, origin, op FROM ops WHERE lsn > ? ORDER BY lsn", (self.lsn,)
+        ).fetchall()
+        applied = 0
+        for lsn, origin, text in rows:
+            if origin != self.origin:
+                self._apply(json.loads(text))
+                applied += 1
+            self.lsn = lsn
+        self._ack()
+        return applied
+
+    def _ack(self) -> None:
+        # caller holds _rlock: tell log trimming how far we are, now and then
+        now = time.time()
+        if now - self._acked_at < ACK_EVERY_SECONDS:
+            return
+        self._acked_at = now
+        self._db.execute(
+            "INSERT INTO replicas (origin, lsn, seen) VALUES (?, ?, ?) "
+            "ON CONFLICT(origin) DO UPDATE SET lsn = excluded.lsn, seen = excluded.seen",
+            (self.origin, self.lsn, now),
+        )
+        row = self._db.execute("SELECT lsn FROM snapshot WHERE id = 1").fetchone()
+        if row:
+            self.snapshot_lsn = max(self.snapshot_lsn, row[0])  # another process may have written one
+
+    # ---------- locks ----------
+    def lock(self, name: str) -> _Section:
+        return _Section(self)
+
+    def forget_lock(self, name: str) -> None:
+        pass
+
+    # ---------- presence ----------
+    def heartbeat(self, user: str, now: float) -> None:
+        if now - self._beats.get(user, 0.0) < HEARTBEAT_WRITE_SECONDS:
+            return
+        with self._rlock:
+            self._beats[user] = now
+            self._db.execute(
+                "INSERT INTO presence (user, seen) VALUES (?, ?) "
+                "ON CONFLICT(user) DO UPDATE SET seen = excluded.seen",
+                (user, now),
+            )
+
+    def last_seen(self, user: str) -> float | None:
+        with self._rlock:
+            row = self._db.execute("SELECT seen FROM presence WHERE user = ?", (user,)).fetchone()
+        return row[0] if row else None
+
+    def drop_presence(self, user: str) -> None:
+        with self._rlock:
+            self._beats.pop(user, None)
+            self._db.execute("DELETE FROM presence WHERE user = ?", (user,))
+
+    # ---------- recovery ----------
+    def load(self) -> tuple[dict | None, list[dict]]:
+        """
+        (snapshot state or None, ops logged after it, oldest first).
+        Call once, before set_applier and the first append.
+        """
+        state, tail = None, []
+        with self._rlock:
+            self._db.execute("BEGIN")  # snapshot + tail from one consistent read
+            try:
+                row = self._db.execute("SELECT lsn, state FROM snapshot WHERE id = 1").fetchone()
+                if row:
+                    self.snapshot_lsn = self.lsn = row[0]
+                    state = json.loads(row[1])
+                for lsn, text in self._db.execute("SELECT lsn, op FROM ops WHERE lsn > ? ORDER BY lsn", (self.lsn,)):
+                    tail.append(json.loads(text))
+                    self.lsn = lsn
+            finally:
+                self._db.execute("COMMIT")
+        return state, tail
+
+    def snapshot_due(self) -> bool:
+        return not self._snapshotting and self.lsn - self.snapshot_lsn >= self.snapshot_every
+
+    def begin_snapshot(self) -> int | None:
+        """
+        Catch up with the log and return the lsn that a state copy taken
+        from now on covers, or None if a snapshot is already being written.
+        """
+        with self._rlock:
+            if self._snapshotting:
+                return None
+            self._snapshotting = True
+            self._sync()
+            return self.lsn
+
+    def write_snapshot(self, lsn: int, state: dict) -> None:
+        """Store state as of lsn (unless a newer one is there), then trim the log."""
+        try:
+            text = json.dumps(state, ensure_ascii=False, separators=(",", ":"))
+            conn = _connect(self.path)  # own connection: the session threads keep theirs
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(
+                    "INSERT INTO snapshot (id, lsn, state) VALUES (1, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET lsn = excluded.lsn, state = excluded.state "
+                    "WHERE excluded.lsn > snapshot.lsn",
+                    (lsn, text),
+                )
+                covered = conn.execute("SELECT lsn FROM snapshot WHERE id = 1").fetchone()[0]
+                alive = time.time() - REPLICA_TIMEOUT_SECONDS
+                conn.execute("DELETE FROM replicas WHERE seen < ?", (alive,))
+                slowest = conn.execute("SELECT MIN(lsn) FROM replicas").fetchone()[0]
+                keep_after = covered if slowest is None else min(covered, slowest)
+                conn.execute("DELETE FROM ops WHERE lsn <= ?", (keep_after,))
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+            self.snapshot_lsn = max(self.snapshot_lsn, covered)
+        finally:
+            self._snapshotting = False
+
+
+class SQLiteChatLog(ChatLog):
+    """
+    ChatLog over the shared database's chat table, so every process sees
+    the same messages and seqs. The newest messages are mirrored in the
+    ring buffer, which catches up with one indexed query per read; older
+    pages are read from the table instead of archive segments.
+    """
+
+    def __init__(self, backend: SQLiteBackend, capacity: int = LIVE_CAPACITY):
+        self._backend = backend
+        super().__init__(capacity=capacity)
+
+    def _query(self, sql: str, args: tuple) -> list[dict]:
+        b = self._backend
+        with b._rlock:
+            rows = b._db.execute(sql, args).fetchall()
+        return [dict(json.loads(msg), seq=seq) for seq, msg in rows]
+
+    def _recover(self) -> None:
+        self._catch_up()
+
+    def _catch_up(self) -> None:
+        # only the newest `capacity` new messages matter to the ring
+        newest = self._query(
+            "SELECT seq, msg FROM chat WHERE seq >= ? ORDER BY seq DESC LIMIT ?",
+            (self.next_seq, self._live.maxlen),
+        )
+        if not newest:
+            return
+        newest.reverse()
+        with self._lock:
+            if newest[0]["seq"] != self.next_seq:
+                self._live.clear()  # skipped past the ring: start it over
+            for m in newest:
+                if m["seq"] >= self.next_seq:
+                    self._live.append(m)
+                    self.next_seq = m["seq"] + 1
+
+    def append(self, msg: dict) -> dict:
+        text = json.dumps(msg, ensure_ascii=False)
+        b = self._backend
+        with b._rlock:
+            cur = b._db.execute(
+                "INSERT INTO chat (seq, msg) SELECT COALESCE(MAX(seq) + 1, 0), ? FROM chat", (text,)
+            )
+            seq = cur.lastrowid  # seq is the rowid
+        self._catch_up()
+        return dict(msg, seq=seq)
+
+    def latest(self, n: int = 20) -> list[dict]:
+        self._catch_up()
+        return super().latest(n)
+
+    def _range(self, lo: int, hi: int) -> list[dict]:
+        self._catch_up()
+        lo = max(0, lo)
+        with self._lock:
+            hi = min(hi, self.next_seq)
+            live_first = self.next_seq - len(self._live)
+            live = [self._live[s - live_first] for s in range(max(lo, live_first), hi)]
+        if lo >= live_first:
+            return live
+        older = self._query(
+            "SELECT seq, msg FROM chat WHERE seq >= ? AND seq < ? ORDER BY seq", (lo, min(hi, live_first))
+        )
+        return older + live
+
+    def __len__(self) -> int:
+        self._catch_up()
+        return self.next_seq
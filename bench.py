@@ -0,0 +1,314 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from pathlib import Path
+
+# ==============================
+# BENCHMARKS FOR THE HOT PATHS
+# ==============================
+# Synthetic check-in histories, wallet populations, lobbies and boards of
+# increasing size, run through the core logic (no Streamlit rendering):
+#
+#   python bench.py                              every case at every size
+#   python bench.py --sizes 100 100000           pick the sizes
+#   python bench.py --only wallet game.prune     cases starting with these names
+#   python bench.py --save                       write bench_baseline.json
+#   python bench.py --compare                    compare against it (exit 1 on regressions)
+#
+# Each case reports per-operation latency (median and p95 over the timed
+# runs) and the peak memory allocated during one operation (tracemalloc,
+# measured in a separate untimed run). Everything runs inside a temporary
+# directory, so the project's own data files are never touched.
+
+BASELINE_PATH = Path("bench_baseline.json")
+SIZES = (100, 1_000, 10_000)
+REPEATS = 20          # timed runs per case and size
+TIME_BUDGET = 2.0     # ...unless they take longer than this many seconds
+REGRESSION = 1.25     # --compare flags a median this much slower than the baseline
+SEED = 7
+
+CASES = {}  # name -> (build(size, rng) -> (prepare, op), sized)
+
+
+def case(name: str, sized: bool = True):
+    """
+    Register build(size, rng) -> (prepare, op). prepare() (may be None)
+    runs untimed before every op() and returns its argument, so stateful
+    operations start each run from the same place.
+    """
+    def deco(fn):
+        CASES[name] = (fn, sized)
+        return fn
+    return deco
+
+
+# ---------- synthetic data ----------
+def _history(n_days: int, rng: random.Random, end: date | None = None) -> list[dict]:
+    """n_days check-ins ending yesterday, with ~15% of days skipped."""
+    from synth import history
+    return history(rng, n_days, end or date.today() - timedelta(days=1))
+
+
+def _wallets(n_users: int, rng: random.Random) -> dict:
+    """wallets.json-style dict, legacy helper_score records included."""
+    from synth import wallet_entry
+    today = date.today()
+    return {f"user{i}": wallet_entry(rng, today) for i in range(n_users)}
+
+
+def _ledger(n_users: int, rng: random.Random, name: str):
+    from wallet import WalletLedger
+    ledger = WalletLedger(Path(f"{name}.db"))
+    ledger.import_legacy(_wallets(n_users, rng))
+    return ledger
+
+
+def _game_state() -> dict:
+    import game
+    from backend import MemoryBackend
+    from events import VersionBus
+    shared = {"events": VersionBus(), "backend": MemoryBackend(state_dir=None)}
+    game._ensure_game_keys(shared)
+    return shared
+
+
+# ---------- cases ----------
+@case("streaks.compute_streaks")
+def _bench_streaks(size, rng):
+    from daily import compute_streaks
+    checkins = _history(size, rng)
+    return None, lambda _: compute_streaks(checkins, grace_days=1)
+
+
+@case("checkin.upsert_today")
+def _bench_upsert(size, rng):
+    from daily import build_checkin_stats, upsert_today_checkin
+    checkins = _history(size, rng)
+    return (
+        lambda: build_checkin_stats(checkins),
+        lambda stats: upsert_today_checkin(checkins, "Calm", "Okay", stats),
+    )
+
+
+@case("heatmap.index")
+def _bench_heat_index(size, rng):
+    from daily import heat_index_from_checkins
+    checkins = _history(size, rng)
+    return None, lambda _: heat_index_from_checkins(checkins)
+
+
+@case("heatmap.spec")
+def _bench_heat_spec(size, rng):
+    # grid + chart spec that calendar_heatmap caches and renders
+    from daily import _heatmap_spec, heat_index_from_checkins
+    heat = heat_index_from_checkins(_history(size, rng))
+    today = date.today()
+    return None, lambda _: _heatmap_spec(heat, 16, today)
+
+
+@case("wallet.maybe_award_daily_coins")
+def _bench_award(size, rng):
+    from daily import build_checkin_stats
+    from wallet import maybe_award_daily_coins
+    ledger = _ledger(size, rng, "award")
+    checkins = _history(30, rng, end=date.today())
+    streaks = build_checkin_stats(checkins)["streaks"]
+    users = iter(range(10**9))  # a fresh user each run: an award that actually commits
+    return None, lambda _: maybe_award_daily_coins(ledger, f"user{next(users) % size}", checkins, streaks)
+
+
+@case("wallet.load_wallets")
+def _bench_load(size, rng):
+    # first run: import a legacy wallets.json into a fresh ledger
+    import wallet
+    Path("wallets.json").write_text(json.dumps(_wallets(size, rng)))
+
+    def prepare():
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"load.db{suffix}").unlink(missing_ok=True)
+    return prepare, lambda _: wallet.load_wallets(Path("load.db")).close()
+
+
+@case("wallet.save_wallets")
+def _bench_save(size, rng):
+    from wallet import save_wallets
+    ledger = _ledger(size, rng, "save")
+    return None, lambda _: save_wallets(ledger, Path("export.json"))
+
+
+@case("game.check_winner", sized=False)
+def _bench_check_winner(size, rng):
+    import game
+    board = game._init_board()
+    last = None
+    for i in range(30):  # a mid-game position
+        col = rng.randrange(game.COLS)
+        placed = game._drop_piece(board, col, 1 + i % 2)
+        last = placed or last
+    return None, lambda _: game._check_winner(board, *last)
+
+
+@case("game.enqueue")
+def _bench_enqueue(size, rng):
+    # matchmaking for one newcomer with `size` players queued across 40 trophy bands
+    import game
+    ledger = _ledger(0, rng, "mm")
+    ledger.apply("newcomer", "trophies", trophies=150)
+    queued = [(f"user{i}", rng.randrange(40)) for i in range(size)]
+
+    def prepare():
+        shared = _game_state()
+        now = time.time()
+        for user, band in queued:
+            game._queue_add(shared, user, band, now - rng.random() * 5)
+        return shared
+    return prepare, lambda shared: game._enqueue(shared, ledger, "newcomer")
+
+
+@case("game.prune_lobby")
+def _bench_prune(size, rng):
+    # `size` players in the lobby; 5% of heap entries come due, a fifth of those expire
+    import game
+    now = time.time()
+    ttl = game.LOBBY_TTL_SECONDS
+
+    def prepare():
+        shared = _game_state()
+        backend = shared["backend"]
+        for i in range(size):
+            user = f"user{i}"
+            due = i % 20 == 0
+            joined = now - ttl - 1 if due else now - rng.random() * ttl
+            with game._lock(shared, "lobby"):
+                game._lobby_add(shared, user, joined)
+            if not (due and i % 100 == 0):
+                backend.heartbeat(user, now - rng.random() * 5)
+        return shared
+    return prepare, lambda shared: game._prune_lobby(shared)
+
+
+@case("board.search")
+def _bench_search(size, rng):
+    from board import Board
+    vocab = [f"w{i}" for i in range(max(200, size // 5))]
+    board = Board()
+    for i in range(size):
+        board.add_post(" ".join(rng.choices(vocab, k=5)), " ".join(rng.choices(vocab, k=30)), None)
+    queries = [f"{rng.choice(vocab)} {rng.choice(vocab)[:2]}" for _ in range(64)]
+    it = iter(range(10**9))
+    return None, lambda _: board.search(queries[next(it) % len(queries)])
+
+
+# ---------- runner ----------
+def _measure(build, size: int, repeats: int, budget: float) -> dict:
+    rng = random.Random(SEED * 1_000_003 + size)
+    prepare, op = build(size, rng)
+    prepare = prepare or (lambda: None)
+
+    op(prepare())  # warm-up (imports, caches)
+    times = []
+    started = time.perf_counter()
+    while len(times) < repeats and (len(times) < 3 or time.perf_counter() - started < budget):
+        arg = prepare()
+        gc.collect()
+        t0 = time.perf_counter()
+        op(arg)
+        times.append(time.perf_counter() - t0)
+
+    arg = prepare()
+    gc.collect()
+    tracemalloc.start()
+    op(arg)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times.sort()
+    return {
+        "median_ms": round(statistics.median(times) * 1000, 4),
+        "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 4),
+        "peak_kib": round(peak / 1024, 1),
+        "runs": len(times),
+    }
+
+
+def run(sizes=SIZES, only=None, repeats=REPEATS, budget=TIME_BUDGET, out=sys.stdout) -> dict:
+    """{"meta": ..., "results": {"case@size": {...}}}; prints a row per result."""
+    results = {}
+    here = Path.cwd()
+    src = Path(__file__).resolve().parent
+    if str(src) not in sys.path:
+        sys.path.insert(0, str(src))
+    print(f"{'case':34} {'size':>8} {'median ms':>11} {'p95 ms':>10} {'peak KiB':>10}", file=out)
+    with tempfile.TemporaryDirectory(prefix="qb-bench-") as tmp:
+        os.chdir(tmp)
+        try:
+            for name, (build, sized) in CASES.items():
+                if only and not any(name.startswith(o) for o in only):
+                    continue
+                for size in (sizes if sized else (0,)):
+                    r = _measure(build, size, repeats, budget)
+                    results[f"{name}@{size}"] = r
+                    print(f"{name:34} {size or '-':>8} {r['median_ms']:>11.3f} {r['p95_ms']:>10.3f} {r['peak_kib']:>10.1f}", file=out)
+        finally:
+            os.chdir(here)
+    meta = {
+        "when": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "seed": SEED,
+        "repeats": repeats,
+    }
+    return {"meta": meta, "results": results}
+
+
+def compare(current: dict, baseline: dict, ratio: float = REGRESSION, out=sys.stdout) -> list[str]:
+    """Keys whose median got more than `ratio` times slower; prints every shared key."""
+    slower = []
+    base = baseline.get("results", {})
+    print(f"\n{'case@size':44} {'baseline':>10} {'now':>10} {'ratio':>7}", file=out)
+    for key, r in current["results"].items():
+        if key not in base:
+            continue
+        before = base[key]["median_ms"]
+        change = r["median_ms"] / before if before else 1.0
+        flag = "  slower" if change > ratio else ""
+        if flag:
+            slower.append(key)
+        print(f"{key:44} {before:>10.3f} {r['median_ms']:>10.3f} {change:>6.2f}x{flag}", file=out)
+    return slower
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark the core logic modules.")
+    ap.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    ap.add_argument("--only", nargs="+", help="case name prefixes")
+    ap.add_argument("--repeats", type=int, default=REPEATS)
+    ap.add_argument("--budget", type=float, default=TIME_BUDGET, help="seconds of timed runs per case and size")
+    ap.add_argument("--save", nargs="?", const=BASELINE_PATH, type=Path, help="write results as a baseline")
+    ap.add_argument("--compare", nargs="?", const=BASELINE_PATH, type=Path, help="compare with a saved baseline")
+    args = ap.parse_args(argv)
+
+    current = run(args.sizes, args.only, args.repeats, args.budget)
+    status = 0
+    if args.compare:
+        slower = compare(current, json.loads(args.compare.read_text()))
+        if slower:
+            print(f"\n{len(slower)} regression(s) over {REGRESSION}x", file=sys.stderr)
+            status = 1
+    if args.save:
+        args.save.write_text(json.dumps(current, indent=2))
+        print(f"\nsaved {args.save}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
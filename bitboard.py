@@ -0,0 +1,70 @@
+# ==============================
+# CONNECT FOUR BITBOARD
+# ==============================
+# One int per player. Column c uses bits c*7 .. c*7+5 (bit c*7 is the
+# bottom row); bit c*7+6 is an always-empty sentinel so shifted lines
+# never wrap from one column into the next.
+#
+#   6 13 20 27 34 41 48   <- sentinel row
+#   5 12 19 26 33 40 47   <- top row
+#   ...
+#   0  7 14 21 28 35 42   <- bottom row
+
+ROWS, COLS = 6, 7
+H1 = ROWS + 1
+
+# (direction, shift): vertical 1, horizontal 7, diagonals 6 and 8
+_SHIFTS = (1, H1, H1 - 1, H1 + 1)
+
+
+def new_board() -> dict:
+    # bits[0] = player 1, bits[1] = player 2; heights = pieces per column
+    return {"bits": [0, 0], "heights": [0] * COLS}
+
+
+def bit(row_from_bottom: int, col: int) -> int:
+    return 1 << (col * H1 + row_from_bottom)
+
+
+def has_four(b: int) -> bool:
+    """Shift-and-mask test for four in a row anywhere in b."""
+    for s in _SHIFTS:
+        m = b & (b >> s)
+        if m & (m >> (2 * s)):
+            return True
+    return False
+
+
+def can_drop(board: dict, col: int) -> bool:
+    return 0 <= col < COLS and board["heights"][col] < ROWS
+
+
+def drop(board: dict, col: int, token: int):
+    """
+    O(1) move for token 1 or 2. Returns (row, col) in display coordinates
+    (row 0 = top), or None if the column is full.
+    """
+    if not can_drop(board, col):
+        return None
+    h = board["heights"][col]
+    board["bits"][token - 1] |= bit(h, col)
+    board["heights"][col] = h + 1
+    return (ROWS - 1 - h, col)
+
+
+def is_winner(board: dict, token: int) -> bool:
+    return has_four(board["bits"][token - 1])
+
+
+def is_full(board: dict) -> bool:
+    return all(h >= ROWS for h in board["heights"])
+
+
+def cell(board: dict, row: int, col: int) -> int:
+    """Token at display row/col (row 0 = top): 0 empty, 1 or 2."""
+    b = bit(ROWS - 1 - row, col)
+    if board["bits"][0] & b:
+        return 1
+    if board["bits"][1] & b:
+        return 2
+    return 0
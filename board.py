@@ -0,0 +1,400 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+import random
+from collections import Counter
+
+# ==============================
+# COMMUNITY QUERY BOARD
+# ==============================
+# Posts + replies for the whole server, with a tokenized inverted index so
+# search cost follows the matching postings instead of the board size,
+# replies kept in reputation order so showing the top ones is O(k), and
+# feeds kept sorted as posts and replies arrive.
+
+_TOKEN = re.compile(r"\w+")  # Unicode words: accents and CJK stay searchable
+TITLE_WEIGHT = 3        # a title hit counts like 3 body hits
+PREFIX_EXPANSION = 50   # vocabulary words a partial last term may expand to
+INDEX_CHUNK = 2000      # posts indexed per lock hold when rebuilding after a restore
+
+# Feed name -> how a post's sort key is built. Keys are kept ascending and a
+# feed is read from the end (top of the feed = largest key), so new posts
+# and fresh activity append instead of shifting the whole list. Every key
+# ends in seq, so ties go to the newer post:
+#   newest        (seq,)
+#   unanswered    (seq,)              only posts with no replies yet
+#   most_replies  (reply_count, seq)
+#   active        (last_activity_tick, seq)  a new post or reply is activity
+FEEDS = ("newest", "unanswered", "most_replies", "active")
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN.findall((text or "").casefold())
+
+
+def _new_id(prefix: str) -> str:
+    return f"{prefix}_{int(time.time() * 1000)}_{random.randint(1000, 9999)}"
+
+
+def _reputation(wallet) -> int:
+    return int(wallet.get("reputation", 0)) if wallet else 0
+
+
+class Board:
+    """
+    posts    list of post dicts, oldest first; a post's position is its seq
+    replies  post_id -> list of reply dicts, in arrival order
+    Every write goes through add_post / add_reply, which keep the indexes
+    current under the board's own lock.
+
+    Reply order: each post keeps a sorted list of (-reputation, reply_no, i)
+    keys (i = index into replies[post_id]; equal reputations keep arrival
+    order). follow_wallets() subscribes to the wallet ledger, so when an
+    author's reputation changes only that author's replies are moved.
+
+    Persistence: `log(op)` (e.g. a backend's append) is called with every
+    new post / reply after it is applied, outside the board lock; replay(op) applies one again and
+    ignores ids it already has. snapshot() / restore() dump and bulk-load
+    the whole board, rebuilding the indexes in one pass.
+    """
+
+    def __init__(self, log=None):
+        self._lock = threading.Lock()
+        self._log = log
+        self._bulk = False  # restoring: sorted structures are built at the end
+        self.posts: list[dict] = []
+        self.replies: dict[str, list[dict]] = {}
+        self._seq_of: dict[str, int] = {}            # post_id -> seq
+        self._postings: dict[str, dict[int, int]] = {}  # token -> {seq: weight}
+        self._vocab: list[str] = []                  # sorted tokens, for prefix lookups
+        self.index_ready = True                      # False while a restore is still indexing
+        self._unindexed = 0                          # restored posts not indexed yet
+
+        self._wallet_of = None                       # user -> wallet view (ledger lookup)
+        self._authors: dict[str, object] = {}        # reply author -> latest wallet view
+        self._reply_order: dict[str, list[tuple]] = {}  # post_id -> sorted reply keys
+        self._replied: dict[str, list[tuple]] = {}   # author -> [(post_id, key)]
+        self._reply_log: list[tuple[str, dict]] = []  # (post_id, reply) in arrival order
+        self._reply_ids: set[str] = set()
+
+        self._feeds: dict[str, list[tuple]] = {f: [] for f in FEEDS}  # sorted keys
+        self._feed_key: dict[str, dict[int, tuple]] = {"most_replies": {}, "active": {}}  # seq -> current key
+        self._tick = 0  # activity counter for the "active" feed
+
+    # ---------- writes ----------
+    def add_post(self, title: str, body: str, author: str | None, post_id: str | None = None, at: float | None = None) -> dict:
+        post = {
+            "id": post_id or _new_id("p"),
+            "title": title,
+            "body": body,
+            "author": author,
+            "time": time.time() if at is None else at,
+        }
+        with self._lock:
+            while post_id is None and post["id"] in self._seq_of:
+                post["id"] = _new_id("p")  # same millisecond + same random suffix
+            self._insert_post(post)
+        # logged after our lock is released: a shared backend may take its
+        # own lock here and replay other processes' ops into this board
+        if self._log:
+            self._log({"op": "post", "post": post})
+        return post
+
+    def _insert_post(self, post: dict) -> bool:
+        # caller holds self._lock
+        if post["id"] in self._seq_of:
+            return False
+        seq = len(self.posts)
+        self.posts.append(post)
+        self._seq_of[post["id"]] = seq
+        self.replies.setdefault(post["id"], [])
+        self._reply_order[post["id"]] = []
+        if not self._bulk:  # restore() indexes in the background instead
+            self._index(seq, post)
+        self._feed_insert("newest", seq, (seq,))
+        self._feed_insert("unanswered", seq, (seq,))
+        self._feed_insert("most_replies", seq, (0, seq))
+        self._touch(seq)
+        return True
+
+    def add_reply(self, post_id: str, text: str, author: str | None, reply_id: str | None = None, at: float | None = None) -> dict | None:
+        reply = {
+            "id": reply_id or _new_id("r"),
+            "text": text,
+            "author": author,
+            "time": time.time() if at is None else at,
+        }
+        # the one wallet lookup per reply happens here, on write, outside our lock
+        wallet = self._wallet_of(author) if (author and self._wallet_of) else None
+        with self._lock:
+            while reply_id is None and reply["id"] in self._reply_ids:
+                reply["id"] = _new_id("r")
+            if not self._insert_reply(post_id, reply, wallet):
+                return None
+        if self._log:
+            self._log({"op": "reply", "post_id": post_id, "reply": reply})
+        return reply
+
+    def _insert_reply(self, post_id: str, reply: dict, wallet=None) -> bool:
+        # caller holds self._lock
+        if post_id not in self._seq_of or reply["id"] in self._reply_ids:
+            return False
+        author = reply["author"]
+        replies = self.replies[post_id]
+        replies.append(reply)
+        self._reply_ids.add(reply["id"])
+        if author:
+            wallet = self._authors.setdefault(author, wallet)  # a newer view from the listener wins
+        key = (-_reputation(wallet), len(self._reply_log), len(replies) - 1)
+        self._reply_log.append((post_id, reply))
+        if self._bulk:
+            self._reply_order[post_id].append(key)  # arrival order = sorted while all reps are 0
+        else:
+            bisect.insort(self._reply_order[post_id], key)
+        if author:
+            self._replied.setdefault(author, []).append((post_id, key))
+
+        seq = self._seq_of[post_id]
+        if len(replies) == 1:
+            self._feed_remove("unanswered", (seq,))
+        self._feed_insert("most_replies", seq, (len(replies), seq))
+        self._touch(seq)
+        return True
+
+    # ---------- persistence ----------
+    def replay(self, op: dict) -> None:
+        """Apply a logged op (no-op if it is already on the board)."""
+        wallet = None
+        if op["op"] == "reply":
+            # replies from other processes: look up a new author's reputation
+            # like add_reply does (outside our lock), so they sort right away
+            author = op["reply"]["author"]
+            if author and self._wallet_of and author not in self._authors:
+                wallet = self._wallet_of(author)
+        with self._lock:
+            if op["op"] == "post":
+                self._insert_post(dict(op["post"]))
+            elif op["op"] == "reply":
+                self._insert_reply(op["post_id"], dict(op["reply"]), wallet)
+
+    def snapshot(self) -> dict:
+        """Compact, JSON-able copy: rows instead of dicts, plus the activity order."""
+        with self._lock:
+            posts = [[p["id"], p["title"], p["body"], p["author"], p["time"]] for p in self.posts]
+            replies = [[pid, r["id"], r["text"], r["author"], r["time"]] for pid, r in self._reply_log]
+            active = [k[-1] for k in self._feeds["active"]]  # least recently active first
+        return {"posts": posts, "replies": replies, "active": active}
+
+    def restore(self, snap: dict) -> None:
+        """
+        Bulk-load a snapshot into an empty board. Posts, replies and feeds
+        are ready on return; the search index (the slow part) is left for
+        index_restored(), so call that once the log tail is replayed.
+        """
+        with self._lock:
+            self._bulk = True
+            try:
+                for pid, title, body, author, at in snap.get("posts", ()):
+                    self._insert_post({"id": pid, "title": title, "body": body, "author": author, "time": at})
+                for pid, rid, text, author, at in snap.get("replies", ()):
+                    self._insert_reply(pid, {"id": rid, "text": text, "author": author, "time": at})
+                for seq in snap.get("active", ()):
+                    self._touch(seq)
+            finally:
+                self._bulk = False
+            # the sorted structures, built once instead of insert by insert
+            n = len(self.posts)
+            self._feeds["newest"] = [(s,) for s in range(n)]
+            self._feeds["unanswered"] = [(s,) for s in range(n) if not self.replies[self.posts[s]["id"]]]
+            for feed in ("most_replies", "active"):
+                self._feeds[feed] = sorted(self._feed_key[feed].values())
+            self._unindexed = n
+            self.index_ready = not n
+
+    def index_restored(self, background: bool = True) -> None:
+        """Index the posts restore() loaded (search sees them once index_ready)."""
+        n, self._unindexed = self._unindexed, 0
+        if not n:
+            return
+        if background:
+            threading.Thread(target=self._build_index, args=(n,), daemon=True).start()
+        else:
+            self._build_index(n)
+
+    # ---------- feeds ----------
+    def _feed_remove(self, feed: str, key: tuple) -> None:
+        if self._bulk:
+            return
+        keys = self._feeds[feed]
+        i = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            del keys[i]
+
+    def _feed_insert(self, feed: str, seq: int, key: tuple) -> None:
+        # re-keying a post (more replies, new activity) moves it in O(log n + shift)
+        current = self._feed_key.get(feed)
+        if current is not None:
+            old = current.get(seq)
+            if old is not None:
+                self._feed_remove(feed, old)
+            current[seq] = key
+        if not self._bulk:
+            bisect.insort(self._feeds[feed], key)
+
+    def _touch(self, seq: int) -> None:
+        self._tick += 1
+        self._feed_insert("active", seq, (self._tick, seq))
+
+    def feed(self, name: str, cursor: tuple | None = None, limit: int = 10) -> tuple[list[dict], tuple | None]:
+        """
+        One page of a feed (see FEEDS): posts after the `cursor` key (None =
+        from the top), plus the cursor for the next page, or None at the end.
+        Cursors are sort keys, not offsets, so pages don't shift or repeat
+        when posts move up while someone is paging. O(log n + limit).
+        """
+        with self._lock:
+            keys = self._feeds[name]
+            end = len(keys) if cursor is None else bisect.bisect_left(keys, tuple(cursor))
+            start = max(0, end - limit)
+            page = keys[start:end][::-1]
+            posts = [self.posts[k[-1]] for k in page]
+        return posts, (page[-1] if start > 0 and page else None)
+
+    def feed_size(self, name: str) -> int:
+        return len(self._feeds[name])
+
+    # ---------- reputation order ----------
+    def follow_wallets(self, ledger) -> None:
+        """Read reply authors' wallets from ledger and follow its changes."""
+        if self._wallet_of is not None:
+            return
+        self._wallet_of = ledger.wallet
+        ledger.subscribe(self.on_wallet_change)
+        # authors restored from disk have no wallet view yet: fetch and re-sort once
+        for user in [u for u, w in list(self._authors.items()) if w is None]:
+            self.on_wallet_change(user, ledger.wallet(user))
+
+    def on_wallet_change(self, user: str, wallet) -> None:
+        with self._lock:
+            if user not in self._authors:
+                return  # not a reply author; nothing to reorder
+            old = self._authors[user]
+            self._authors[user] = wallet
+            rep = _reputation(wallet)
+            if rep == _reputation(old):
+                return  # e.g. coins or trophies only: labels update, order stays
+            moved = []
+            for post_id, key in self._replied[user]:
+                order = self._reply_order[post_id]
+                del order[bisect.bisect_left(order, key)]
+                key = (-rep,) + key[1:]
+                bisect.insort(order, key)
+                moved.append((post_id, key))
+            self._replied[user] = moved
+
+    def _index(self, seq: int, post: dict, sort_vocab: bool = True) -> None:
+        weights = Counter(tokenize(post["body"]))
+        for t in tokenize(post["title"]):
+            weights[t] += TITLE_WEIGHT
+        postings = self._postings
+        for t, w in weights.items():
+            plist = postings.get(t)
+            if plist is None:
+                plist = postings[t] = {}
+                if sort_vocab:
+                    bisect.insort(self._vocab, t)
+            plist[seq] = w
+
+    def _build_index(self, upto: int) -> None:
+        # restored posts 0..upto-1, a chunk per lock hold so writers and
+        # readers keep going; posts added meanwhile index themselves
+        for start in range(0, upto, INDEX_CHUNK):
+            with self._lock:
+                for seq in range(start, min(upto, start + INDEX_CHUNK)):
+                    self._index(seq, self.posts[seq], sort_vocab=False)
+            time.sleep(0.001)  # let waiting sessions take the lock between chunks
+        with self._lock:
+            self._vocab = sorted(self._postings)
+            self.index_ready = True
+
+    # ---------- reads ----------
+    def __len__(self) -> int:
+        return len(self.posts)
+
+    def get(self, post_id: str) -> dict | None:
+        seq = self._seq_of.get(post_id)
+        return None if seq is None else self.posts[seq]
+
+    def replies_for(self, post_id: str) -> list[dict]:
+        with self._lock:
+            return list(self.replies.get(post_id, ()))
+
+    def top_replies(self, post_id: str, k: int = 10) -> list[tuple[dict, object]]:
+        """
+        Up to k (reply, author wallet view) pairs, highest author reputation
+        first. O(k): no sorting and no ledger lookups.
+        """
+        with self._lock:
+            replies = self.replies.get(post_id)
+            if not replies:
+                return []
+            return [
+                (replies[i], self._authors.get(replies[i]["author"]))
+                for _, _, i in self._reply_order[post_id][:k]
+            ]
+
+    def reply_count(self, post_id: str) -> int:
+        return len(self.replies.get(post_id, ()))
+
+    def _term_postings(self, term: str, prefix: bool) -> dict[int, int]:
+        if not prefix:
+            return self._postings.get(term, {})
+        # partial word while typing: merge the postings of up to
+        # PREFIX_EXPANSION vocabulary words that start with it
+        merged = {}
+        i = bisect.bisect_left(self._vocab, term)
+        for word in self._vocab[i : i + PREFIX_EXPANSION]:
+            if not word.startswith(term):
+                break
+            for seq, w in self._postings[word].items():
+                if w > merged.get(seq, 0):
+                    merged[seq] = w
+        return merged
+
+    def search(self, query: str, limit: int = 30) -> list[dict]:
+        """
+        Posts containing every query term, best match first (TF-IDF style
+        score; ties go to the newer post). The last term also matches as a
+        word prefix, so results keep up while someone is still typing.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        ends_mid_word = bool(query) and not query[-1].isspace()
+        with self._lock:
+            n = len(self.posts)
+            lists = [
+                self._term_postings(t, prefix=ends_mid_word and i == len(terms) - 1)
+                for i, t in enumerate(terms)
+            ]
+            if not all(lists):
+                return []
+
+            # walk the rarest term's postings and probe the others
+            lists.sort(key=len)
+            idf = [math.log(1 + n / len(p)) for p in lists]
+            scored = []
+            for seq, w in lists[0].items():
+                score = w * idf[0]
+                for p, f in zip(lists[1:], idf[1:]):
+                    w2 = p.get(seq)
+                    if w2 is None:
+                        break
+                    score += w2 * f
+                else:
+                    scored.append((score, seq))
+
+            return [self.posts[seq] for _, seq in heapq.nlargest(limit, scored)]
@@ -0,0 +1,216 @@
+import time
+
+from bitboard import COLS, H1, ROWS, has_four
+
+# ==============================
+# CONNECT FOUR BOT (NEGAMAX + ALPHA-BETA)
+# ==============================
+# Position = (cur, mask): cur holds the stones of the player to move,
+# mask holds every stone. Same bit layout as bitboard.py.
+
+BOT_MOVE_SECONDS = 0.3   # per-move time budget
+WIN_SCORE = 1000
+
+_ORDER = (3, 2, 4, 1, 5, 0, 6)  # centre columns first
+_BOTTOM = [1 << (c * H1) for c in range(COLS)]
+_TOP = [1 << (c * H1 + ROWS - 1) for c in range(COLS)]
+_COLUMN = [((1 << ROWS) - 1) << (c * H1) for c in range(COLS)]
+_BOARD = sum(_COLUMN)
+_CENTRE = _COLUMN[3]
+
+# transposition table flags
+_EXACT, _LOWER, _UPPER = 0, 1, 2
+
+
+class _OutOfTime(Exception):
+    pass
+
+
+def _winning_cells(pos: int, mask: int) -> int:
+    """Empty cells that would complete four for the stones in pos."""
+    # vertical
+    r = (pos << 1) & (pos << 2) & (pos << 3)
+    for s in (H1, H1 - 1, H1 + 1):
+        p = (pos << s) & (pos << 2 * s)
+        r |= p & (pos << 3 * s)
+        r |= p & (pos >> s)
+        p = (pos >> s) & (pos >> 2 * s)
+        r |= p & (pos << s)
+        r |= p & (pos >> 3 * s)
+    return r & (_BOARD ^ mask)
+
+
+def _evaluate(cur: int, mask: int) -> int:
+    # threats (cells that would win) + a small centre bonus
+    opp = cur ^ mask
+    score = 4 * (_winning_cells(cur, mask).bit_count() - _winning_cells(opp, mask).bit_count())
+    score += (cur & _CENTRE).bit_count() - (opp & _CENTRE).bit_count()
+    return score
+
+
+class _Search:
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        self.nodes = 0
+        self.tt = {}  # (cur + mask) -> (depth, value, flag, best_col)
+
+    def negamax(self, cur: int, mask: int, depth: int, alpha: int, beta: int, ply: int) -> int:
+        self.nodes += 1
+        if not self.nodes & 1023 and time.perf_counter() > self.deadline:
+            raise _OutOfTime
+
+        playable = [c for c in _ORDER if not mask & _TOP[c]]
+        if not playable:
+            return 0  # draw
+
+        # a win in one ends the search right here
+        for c in playable:
+            move = (mask + _BOTTOM[c]) & _COLUMN[c]
+            if has_four(cur | move):
+                return WIN_SCORE - ply
+
+        if depth == 0:
+            return _evaluate(cur, mask)
+
+        key = cur + mask
+        alpha0 = alpha
+        best_col = None
+        hit = self.tt.get(key)
+        if hit is not None:
+            d, value, flag, best_col = hit
+            if d >= depth:
+                if flag == _EXACT:
+                    return value
+                if flag == _LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+            if best_col in playable:
+                playable.remove(best_col)
+                playable.insert(0, best_col)
+
+        opp = cur ^ mask
+        best = -WIN_SCORE - 1
+        for c in playable:
+            move = (mask + _BOTTOM[c]) & _COLUMN[c]
+            value = -self.negamax(opp, mask | move, depth - 1, -beta, -alpha, ply + 1)
+            if value > best:
+                best, best_col = value, c
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        flag = _UPPER if best <= alpha0 else (_LOWER if best >= beta else _EXACT)
+        self.tt[key] = (depth, best, flag, best_col)
+        return best
+
+
+def choose_move(board: dict, token: int, budget: float = BOT_MOVE_SECONDS) -> int | None:
+    """
+    Best column for `token` on a bitboard.py board, by iterative deepening
+    until the time budget runs out. None if the board is full.
+    """
+    cur = board["bits"][token - 1]
+    mask = board["bits"][0] | board["bits"][1]
+    playable = [c for c in _ORDER if not mask & _TOP[c]]
+    if not playable:
+        return None
+
+    opp = cur ^ mask
+    for c in playable:
+        if has_four(cur | ((mask + _BOTTOM[c]) & _COLUMN[c])):
+            return c  # take the win
+
+    search = _Search(time.perf_counter() + budget)
+    empty = ROWS * COLS - mask.bit_count()
+    best_col = playable[0]
+    for depth in range(1, empty + 1):
+        try:
+            alpha, col = -WIN_SCORE - 1, None
+            ordered = sorted(playable, key=lambda c: c != best_col)  # last best first
+            for c in ordered:
+                move = (mask + _BOTTOM[c]) & _COLUMN[c]
+                value = -search.negamax(opp, mask | move, depth - 1, -WIN_SCORE - 1, -alpha, 1)
+                if value > alpha:
+                    alpha, col = value, c
+        except _OutOfTime:
+            break
+        best_col = col
+        if abs(alpha) >= WIN_SCORE - ROWS * COLS:
+            break  # forced result found; deeper search won't change it
+    return best_col
+
+
+# ==============================
+# POST-GAME ANALYSIS
+# ==============================
+ANALYSIS_SECONDS = 0.25  # search budget per position
+BLUNDER_MARGIN = 8       # score drop that counts as a blunder (~2 threats)
+
+
+def column_scores(cur: int, mask: int, budget: float = ANALYSIS_SECONDS) -> dict:
+    """
+    Score of every playable column for the side to move (cur), from the
+    deepest iteration that finished inside the budget.
+    """
+    playable = [c for c in _ORDER if not mask & _TOP[c]]
+    scores = {}
+    opp = cur ^ mask
+    search = _Search(time.perf_counter() + budget)
+    empty = ROWS * COLS - mask.bit_count()
+    for depth in range(1, empty + 1):
+        try:
+            done = {}
+            for c in playable:
+                move = (mask + _BOTTOM[c]) & _COLUMN[c]
+                if has_four(cur | move):
+                    done[c] = WIN_SCORE
+                    continue
+                # full window: we want exact scores, not just the best move
+                done[c] = -search.negamax(opp, mask | move, depth - 1, -WIN_SCORE - 1, WIN_SCORE + 1, 1)
+        except _OutOfTime:
+            break
+        scores = done
+        if all(abs(v) >= WIN_SCORE - ROWS * COLS for v in scores.values()):
+            break  # every line is decided
+    if not scores:
+        scores = {c: 0 for c in playable}  # not even depth 1 fit in the budget
+    return scores
+
+
+def analyse_game(columns: list[int], budget: float = ANALYSIS_SECONDS) -> list[dict]:
+    """
+    Replay a finished game (columns in move order, player 1 first) and grade
+    every move against the best one found in that position.
+    Pure function of its arguments, so it can run in a worker process.
+    """
+    bits = [0, 0]
+    out = []
+    for ply, col in enumerate(columns):
+        side = ply % 2
+        cur, mask = bits[side], bits[0] | bits[1]
+        scores = column_scores(cur, mask, budget)
+        best_col = max(scores, key=scores.get)
+        played = scores.get(col, -WIN_SCORE)
+        loss = scores[best_col] - played
+        if played >= WIN_SCORE - ROWS * COLS or loss <= 0:
+            verdict = "best"
+        elif scores[best_col] >= WIN_SCORE - ROWS * COLS:
+            verdict = "missed win"
+        elif loss >= BLUNDER_MARGIN:
+            verdict = "blunder"
+        else:
+            verdict = "ok"
+        out.append({
+            "ply": ply + 1,
+            "player": side + 1,
+            "col": col,
+            "best": best_col,
+            "score": played,
+            "best_score": scores[best_col],
+            "verdict": verdict,
+        })
+        bits[side] |= (mask + _BOTTOM[col]) & _COLUMN[col]
+    return out
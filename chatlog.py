@@ -0,0 +1,144 @@
+import json
+import threading
+from collections import OrderedDict, deque
+from itertools import islice
+from pathlib import Path
+
+# ==============================
+# CHAT LOG (RING BUFFER + SEGMENT ARCHIVE)
+# ==============================
+CHAT_ARCHIVE_DIR = Path("chat_archive")
+LIVE_CAPACITY = 200      # messages kept in memory
+SEGMENT_SIZE = 500       # messages per archive file
+SEGMENT_CACHE = 8        # sealed segments kept parsed for scrollback
+
+
+class ChatLog:
+    """
+    Shared chat history for the server.
+    The newest LIVE_CAPACITY messages live in a fixed-size ring buffer, so
+    memory stays flat however long the server runs. Every message is also
+    appended to an on-disk segment (chat_archive/<first_seq>.jsonl, one JSON
+    object per line), which keeps older history retrievable.
+    Each message gets an increasing integer "seq".
+    """
+
+    def __init__(self, archive_dir: Path = CHAT_ARCHIVE_DIR, capacity: int = LIVE_CAPACITY, segment_size: int = SEGMENT_SIZE):
+        self.archive_dir = Path(archive_dir)
+        self.segment_size = segment_size
+        self._live = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self.next_seq = 0
+        self._segments = OrderedDict()  # first_seq -> parsed sealed segment (LRU)
+        self._cache_lock = threading.Lock()  # guards _segments; kept apart so reads never block append
+        self._recover()
+
+    # ---------- disk ----------
+    def _segment_path(self, first_seq: int) -> Path:
+        return self.archive_dir / f"{first_seq:012d}.jsonl"
+
+    def segment_starts(self) -> list[int]:
+        if not self.archive_dir.exists():
+            return []
+        return sorted(int(p.stem) for p in self.archive_dir.glob("*.jsonl") if p.stem.isdigit())
+
+    def read_segment(self, first_seq: int) -> list[dict]:
+        path = self._segment_path(first_seq)
+        if not path.exists():
+            return []
+        out = []
+        for line in path.read_text(encoding="utf-8").splitlines():
+            try:
+                out.append(json.loads(line))
+            except ValueError:
+                continue  # torn last line after a crash
+        return out
+
+    def _recover(self) -> None:
+        # continue numbering after the archive and refill the live window
+        starts = self.segment_starts()
+        tail = []
+        for first in starts[-2:]:
+            tail.extend(self.read_segment(first))
+        if tail:
+            self.next_seq = int(tail[-1]["seq"]) + 1
+            self._live.extend(tail[-self._live.maxlen:])
+
+    # ---------- API ----------
+    def append(self, msg: dict) -> dict:
+        with self._lock:
+            seq = self.next_seq
+            rec = dict(msg, seq=seq)
+            first = seq - seq % self.segment_size
+            self.archive_dir.mkdir(parents=True, exist_ok=True)
+            with self._segment_path(first).open("a", encoding="utf-8") as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self._live.append(rec)
+            self.next_seq = seq + 1
+        return rec
+
+    def latest(self, n: int = 20) -> list[dict]:
+        """Newest n messages (oldest first), from memory."""
+        with self._lock:
+            newest = list(islice(reversed(self._live), n))
+        newest.reverse()
+        return newest
+
+    def _archived(self, first_seq: int) -> list[dict]:
+        # sealed segments never change, so they can be cached; the open one is reread
+        sealed = first_seq + self.segment_size <= self.next_seq
+        if sealed:
+            with self._cache_lock:
+                msgs = self._segments.get(first_seq)
+                if msgs is not None:
+                    self._segments.move_to_end(first_seq)
+                    return msgs
+        msgs = self.read_segment(first_seq)  # file read outside the lock
+        if sealed:
+            with self._cache_lock:
+                self._segments[first_seq] = msgs
+                self._segments.move_to_end(first_seq)
+                while len(self._segments) > SEGMENT_CACHE:
+                    self._segments.popitem(last=False)
+        return msgs
+
+    def _range(self, lo: int, hi: int) -> list[dict]:
+        """Messages with lo <= seq < hi (hi - lo is a page, never the whole log)."""
+        lo = max(0, lo)
+        with self._lock:
+            hi = min(hi, self.next_seq)
+            live_first = self.next_seq - len(self._live)
+            live = [self._live[s - live_first] for s in range(max(lo, live_first), hi)]
+        if lo >= live_first:
+            return live
+
+        # the older part comes from the archive (at most two segments per page)
+        older = []
+        seq = lo
+        stop = min(hi, live_first)
+        while seq < stop:
+            first = seq - seq % self.segment_size
+            for m in self._archived(first):
+                if seq <= m["seq"] < stop:
+                    older.append(m)
+            seq = first + self.segment_size
+        return older + live
+
+    def page(self, before: int | None = None, limit: int = 20) -> tuple[list[dict], int | None]:
+        """
+        Scrollback: up to `limit` messages older than the `before` cursor
+        (a seq; None = newest). Returns (messages oldest first, next cursor),
+        where the next cursor is None once the start of history is reached.
+        """
+        hi = self.next_seq if before is None else before
+        lo = max(0, hi - limit)
+        msgs = self._range(lo, hi)
+        return msgs, (lo if lo > 0 else None)
+
+    def since(self, seq: int, limit: int = 100) -> list[dict]:
+        """Up to `limit` messages from seq onwards (oldest first)."""
+        return self._range(seq, seq + limit)
+
+    def __len__(self) -> int:
+        # total messages ever posted, not just the live window
+        return self.next_seq
@@ -1,46 +1,98 @@
 
+import hashlib
 import json
+import os
+import threading
+from array import array
 from pathlib import Path
 from datetime import date, timedelta, datetime
 from zoneinfo import ZoneInfo
 
 
 
+import numpy as np
 import pandas as pd
 import altair as alt
 import streamlit as st
 
 from mood_logic import mood_to_num
+from streaks import push_day, read_streaks, state_from_days, streaks_from_days
+from rollups import add_checkin, recent_stats, rollup_from_checkins, week_count
+from profiler import timed
 # !!!!!!!!
 # ==============================
 # DAILY CHECK-IN STREAK (ADVANCED)
 # ==============================
 
-CHECKINS_PATH = Path("checkins.json")
-
-def load_checkins() -> list[dict]:
-    if not CHECKINS_PATH.exists():
+CHECKINS_PATH = Path("checkins.json")  # legacy single file (not per user)
+CHECKINS_DIR = Path("checkins")         # one shard per user: checkins/<user>.json
+
+def _shard_path(user: str) -> Path:
+    safe = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in user)
+    if safe != user or not safe:
+        # keep odd names apart once they are sanitized
+        safe = f"{safe}-{hashlib.sha1(user.encode('utf-8')).hexdigest()[:8]}"
+    return CHECKINS_DIR / f"{safe}.json"
+
+@timed("load_checkins")
+def load_checkins(user: str) -> list[dict]:
+    """Only reads this user's shard, so cost is O(their history)."""
+    path = _shard_path(user)
+    if not path.exists():
         return []
     try:
-        return json.loads(CHECKINS_PATH.read_text(encoding="utf-8"))
+        return json.loads(path.read_text(encoding="utf-8"))
     except Exception:
         return []
 
-def save_checkins(checkins: list[dict]) -> None:
-    CHECKINS_PATH.write_text(json.dumps(checkins, ensure_ascii=False, indent=2), encoding="utf-8")
+@timed("save_checkins")
+def save_checkins(user: str, checkins: list[dict]) -> None:
+    """Rewrites only this user's shard (atomic replace, so readers never see half a file)."""
+    path = _shard_path(user)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(checkins, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+def build_checkin_stats(checkins: list[dict]) -> dict:
+    """
+    Derived per-user state, built once per session in one pass and then
+    kept up to date by upsert_today_checkin.
+    """
+    return {
+        "streaks": state_from_days(unique_dates(checkins)),
+        "rollup": rollup_from_checkins(checkins),
+        "heat": heat_index_from_checkins(checkins),
+    }
 
-def upsert_today_checkin(checkins: list[dict], word: str, mode: str) -> list[dict]:
+def upsert_today_checkin(checkins: list[dict], word: str, mode: str, stats: dict | None = None) -> list[dict]:
     """
     One check-in per day: saving again overwrites today's entry.
     Stores both the selected Mood Meter word and the backend mode.
+    If stats (from build_checkin_stats) is given it is updated in place.
     """
     today = date.today().isoformat()
     level = mood_to_num(mode)
     rec = {"date": today, "word": word, "mode": mode, "level": level}
 
-    out = [c for c in checkins if c.get("date") != today]
-    out.append(rec)
-    out.sort(key=lambda x: x.get("date", ""))
+    last = checkins[-1].get("date", "") if checkins else ""
+    if last == today:
+        out = checkins[:-1] + [rec]
+    elif last < today:
+        out = checkins + [rec]
+    else:
+        # history isn't sorted (or has future dates): fall back to a full rebuild
+        out = [c for c in checkins if c.get("date") != today]
+        out.append(rec)
+        out.sort(key=lambda x: x.get("date", ""))
+
+    if stats is not None:
+        try:
+            push_day(stats["streaks"], date.fromisoformat(today))
+            add_checkin(stats["rollup"], rec)
+            add_heat_day(stats["heat"], date.fromisoformat(today), level)
+        except ValueError:
+            stats.update(build_checkin_stats(out))
     return out
 
 def unique_dates(checkins: list[dict]) -> set[date]:
@@ -55,42 +107,9 @@ def compute_streaks(checkins: list[dict], grace_days: int = 0) -> dict:
     """
     grace_days=0 strict streak
     grace_days=1 gentle streak: allows 1 missed day while counting
+    Single sorted pass (see streaks.py).
     """
-    days = unique_dates(checkins)
-    if not days:
-        return {"current": 0, "best": 0}
-
-    # current streak (strictly from today backwards; gentle allows misses)
-    cur = 0
-    misses = 0
-    cursor = date.today()
-    while True:
-        if cursor in days:
-            cur += 1
-        else:
-            misses += 1
-            if misses > grace_days:
-                break
-        cursor -= timedelta(days=1)
-
-    # best streak (scan day-by-day across history)
-    sorted_days = sorted(days)
-    best = 0
-    for start in sorted_days:
-        streak = 0
-        misses = 0
-        cursor = start
-        while True:
-            if cursor in days:
-                streak += 1
-            else:
-                misses += 1
-                if misses > grace_days:
-                    break
-            cursor += timedelta(days=1)
-        best = max(best, streak)
-
-    return {"current": cur, "best": best}
+    return streaks_from_days(unique_dates(checkins), grace_days)
 
 def week_progress(checkins: list[dict], goal: int = 5) -> tuple[int, int]:
     today = date.today()
@@ -121,34 +140,90 @@ def mood_stats_7d(checkins: list[dict]) -> dict:
 
     return {"avg_level": avg, "top_word": top_word}
 
-def calendar_heatmap(checkins: list[dict], weeks: int = 16):
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def _week_key(o: int) -> int:
+    # ordinal of the Monday starting that week
+    return o - (o + 6) % 7
+
+def _month_key(o: int) -> int:
+    d = date.fromordinal(o)
+    return d.year * 12 + d.month - 1
+
+def _bump_agg(agg: dict, key: int, count: int, level: int) -> None:
+    cell = agg.setdefault(key, [0, 0])
+    cell[0] += count
+    cell[1] += level
+    if not cell[0]:
+        del agg[key]
+
+def heat_index_from_checkins(checkins: list[dict]) -> dict:
     """
-    GitHub-style heatmap for the last N weeks.
-    level: 0 (no check-in) to 4
+    Compact per-user arrays for the heatmap: sorted day ordinals (int32)
+    and their levels (int8), one entry per day (latest record wins).
+    Also weekly / monthly [count, level_sum] aggregates for the zoomed-out view.
     """
-    if not checkins:
-        st.info("No check-ins yet.")
-        return
-
-    # latest level per day
     day_level = {}
     for c in checkins:
         if c.get("date"):
-            day_level[date.fromisoformat(c["date"])] = int(c.get("level", 3))
-
-    end = date.today()
-    start = end - timedelta(days=weeks * 7 - 1)
+            day_level[date.fromisoformat(c["date"]).toordinal()] = int(c.get("level", 3))
+    days = sorted(day_level)
+
+    weekly, monthly = {}, {}
+    for o in days:
+        _bump_agg(weekly, _week_key(o), 1, day_level[o])
+        _bump_agg(monthly, _month_key(o), 1, day_level[o])
+    return {
+        "days": array("i", days),
+        "levels": array("b", (day_level[d] for d in days)),
+        "weekly": weekly,
+        "monthly": monthly,
+    }
 
-    rows = []
-    d = start
-    while d <= end:
-        lvl = day_level.get(d, 0)
-        week_idx = (d - start).days // 7
-        dow = d.weekday()  # Mon=0..Sun=6
-        rows.append({"date": d.isoformat(), "week": week_idx, "dow": dow, "level": lvl})
-        d += timedelta(days=1)
+def add_heat_day(heat: dict, day: date, level: int) -> None:
+    o = day.toordinal()
+    days = heat["days"]
+    if days and days[-1] == o:
+        old = heat["levels"][-1]
+        heat["levels"][-1] = level
+        _bump_agg(heat["weekly"], _week_key(o), 0, level - old)
+        _bump_agg(heat["monthly"], _month_key(o), 0, level - old)
+    elif not days or days[-1] < o:
+        days.append(o)
+        heat["levels"].append(level)
+        _bump_agg(heat["weekly"], _week_key(o), 1, level)
+        _bump_agg(heat["monthly"], _month_key(o), 1, level)
+    else:
+        raise ValueError("heatmap days must be added in date order")
 
-    df = pd.DataFrame(rows)
+def heatmap_frame(days: np.ndarray, levels: np.ndarray, weeks: int, end: date, align: bool = False) -> pd.DataFrame:
+    """
+    Day grid for the last N weeks, built with array ops (no per-day Python loop).
+    align=True starts the grid on a Monday so each column is a calendar week.
+    """
+    end_o = end.toordinal()
+    if align:
+        start_o = _week_key(end_o) - (weeks - 1) * 7
+    else:
+        start_o = end_o - weeks * 7 + 1
+    grid = np.arange(start_o, end_o + 1, dtype=np.int32)
+
+    lvl = np.zeros(grid.size, dtype=np.int8)
+    lo, hi = np.searchsorted(days, [start_o, end_o + 1])
+    lvl[days[lo:hi] - start_o] = levels[lo:hi]
+
+    offset = grid - start_o
+    return pd.DataFrame({
+        "date": (grid - _EPOCH_ORDINAL).astype("datetime64[D]").astype(str),
+        "week": offset // 7,
+        "dow": (grid + 6) % 7,  # Mon=0..Sun=6 (ordinal 1 was a Monday)
+        "level": lvl,
+    })
+
+def _heatmap_spec(heat: dict, weeks: int, end: date) -> dict:
+    days = np.frombuffer(heat["days"], dtype=np.int32)
+    levels = np.frombuffer(heat["levels"], dtype=np.int8)
+    df = heatmap_frame(days, levels, weeks, end)
 
     chart = (
         alt.Chart(df)
@@ -171,8 +246,188 @@ def calendar_heatmap(checkins: list[dict], weeks: int = 16):
         )
         .properties(height=400)
     )
+    return chart.to_dict()
+
+@st.cache_resource(max_entries=512, show_spinner=False)
+def _cached_heatmap_spec(user: str, n_days: int, last_day: int, last_level: int, weeks: int, end: date, _heat: dict) -> dict:
+    # _heat is not hashed; the other args identify the user's history
+    return _heatmap_spec(_heat, weeks, end)
 
-    st.altair_chart(chart, use_container_width=True)
+@timed("heatmap")
+def calendar_heatmap(checkins: list[dict], weeks: int = 16, user: str | None = None, stats: dict | None = None):
+    """
+    GitHub-style heatmap for the last N weeks.
+    level: 0 (no check-in) to 4
+    With user + stats the finished chart spec is cached per
+    (user, last check-in, weeks, today), so repeat views skip the rebuild.
+    """
+    if not checkins:
+        st.info("No check-ins yet.")
+        return
+
+    heat = stats["heat"] if stats is not None else heat_index_from_checkins(checkins)
+    if not heat["days"]:
+        st.info("No check-ins yet.")
+        return
+
+    if user is not None and stats is not None:
+        spec = _cached_heatmap_spec(
+            user,
+            len(heat["days"]),
+            heat["days"][-1],
+            heat["levels"][-1],
+            weeks,
+            date.today(),
+            _heat=heat,
+        )
+    else:
+        spec = _heatmap_spec(heat, weeks, date.today())
+    st.vega_lite_chart(spec, use_container_width=True)
+
+
+# ==============================
+# ZOOMED-OUT HISTORY (DOWNSAMPLED)
+# ==============================
+MONTH_LABELS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+def history_frames(heat: dict, end: date, daily_weeks: int = 16, weekly_weeks: int = 52) -> dict:
+    """
+    Cells for the zoomed-out view, newest to oldest:
+      daily    last `daily_weeks` calendar weeks, one cell per day
+      weekly   up to `weekly_weeks` weeks before that, mean level + count
+      monthly  every older month back to the first check-in
+    Aggregates come from the precomputed weekly/monthly index, so the
+    work depends on the time span shown, not on the number of check-ins.
+    The weekly tier starts on the Monday on or before the 1st of the month
+    the monthly tier stops at, so every day is in some tier; up to 6 days
+    from the previous month show in both.
+    """
+    days = np.frombuffer(heat["days"], dtype=np.int32)
+    levels = np.frombuffer(heat["levels"], dtype=np.int8)
+    daily = heatmap_frame(days, levels, daily_weeks, end, align=True)
+
+    daily_start = _week_key(end.toordinal()) - (daily_weeks - 1) * 7
+    first = date.fromordinal(daily_start - weekly_weeks * 7)
+    first_month = first.year * 12 + first.month - 1
+    weekly_start = _week_key(date(first.year, first.month, 1).toordinal())  # week holding the 1st
+
+    def cell(agg, key):
+        count, total = agg.get(key, (0, 0))
+        return count, (total / count if count else 0.0)
+
+    weekly_rows = []
+    for i, wk in enumerate(range(weekly_start, daily_start, 7)):
+        count, mean = cell(heat["weekly"], wk)
+        weekly_rows.append({
+            "start": date.fromordinal(wk).isoformat(),
+            "week": i,
+            "level": round(mean, 2),
+            "count": count,
+        })
+
+    monthly_rows = []
+    if len(days):
+        oldest = _month_key(int(days[0]))
+        for mk in range(oldest, first_month):
+            count, mean = cell(heat["monthly"], mk)
+            year, month = divmod(mk, 12)
+            monthly_rows.append({
+                "start": f"{MONTH_LABELS[month]} {year}",
+                "year": year,
+                "month": month,
+                "level": round(mean, 2),
+                "count": count,
+            })
+
+    return {
+        "daily": daily,
+        "weekly": pd.DataFrame(weekly_rows),
+        "monthly": pd.DataFrame(monthly_rows),
+    }
+
+def _history_spec(heat: dict, end: date, daily_weeks: int, weekly_weeks: int) -> dict:
+    frames = history_frames(heat, end, daily_weeks, weekly_weeks)
+    color = alt.Color("level:Q", scale=alt.Scale(domain=[0, 1, 2, 3, 4]), legend=None)
+    parts = []
+
+    if not frames["monthly"].empty:
+        parts.append(
+            alt.Chart(frames["monthly"], title="Monthly (avg level)")
+            .mark_rect()
+            .encode(
+                x=alt.X(
+                    "month:O",
+                    title=None,
+                    scale=alt.Scale(domain=list(range(12))),
+                    axis=alt.Axis(labelExpr=f"{MONTH_LABELS}[datum.value]"),
+                ),
+                y=alt.Y("year:O", title=None),
+                color=color,
+                tooltip=["start:N", "level:Q", "count:Q"],
+            )
+        )
+
+    if not frames["weekly"].empty:
+        parts.append(
+            alt.Chart(frames["weekly"], title="Weekly (avg level)")
+            .mark_rect()
+            .encode(
+                x=alt.X("week:O", title=None, axis=alt.Axis(labels=False, ticks=False)),
+                color=color,
+                tooltip=["start:N", "level:Q", "count:Q"],
+            )
+            .properties(height=28)
+        )
+
+    parts.append(
+        alt.Chart(frames["daily"], title="Daily")
+        .mark_rect()
+        .encode(
+            x=alt.X("week:O", title=None, axis=alt.Axis(labels=False, ticks=False)),
+            y=alt.Y(
+                "dow:O",
+                title=None,
+                sort=[0, 1, 2, 3, 4, 5, 6],
+                axis=alt.Axis(
+                    values=[0, 1, 2, 3, 4, 5, 6],
+                    labelExpr="['Mon','Tue','Wed','Thu','Fri','Sat','Sun'][datum.value]",
+                ),
+            ),
+            color=color,
+            tooltip=["date:N", "level:Q"],
+        )
+    )
+    return alt.vconcat(*parts).to_dict()
+
+@st.cache_resource(max_entries=512, show_spinner=False)
+def _cached_history_spec(user: str, n_days: int, last_day: int, last_level: int, end: date, daily_weeks: int, weekly_weeks: int, _heat: dict) -> dict:
+    return _history_spec(_heat, end, daily_weeks, weekly_weeks)
+
+@timed("history_heatmap")
+def history_heatmap(checkins: list[dict], user: str | None = None, stats: dict | None = None, daily_weeks: int = 16, weekly_weeks: int = 52):
+    """
+    Zoomed-out check-in map: days for recent weeks, then weekly and
+    monthly averages for older history. Cached like calendar_heatmap.
+    """
+    heat = stats["heat"] if stats is not None else heat_index_from_checkins(checkins)
+    if not heat["days"]:
+        st.info("No check-ins yet.")
+        return
+
+    if user is not None and stats is not None:
+        spec = _cached_history_spec(
+            user,
+            len(heat["days"]),
+            heat["days"][-1],
+            heat["levels"][-1],
+            date.today(),
+            daily_weeks,
+            weekly_weeks,
+            _heat=heat,
+        )
+    else:
+        spec = _history_spec(heat, date.today(), daily_weeks, weekly_weeks)
+    st.vega_lite_chart(spec, use_container_width=True)
 
 
 def avg_mood_level_7d_from_moods(moods: list) -> float | None:
@@ -204,7 +459,8 @@ def avg_mood_level_7d_from_moods(moods: list) -> float | None:
     return sum(vals) / len(vals)
 
 
-def renderstreak_card(checkins: list[dict], moods: list | None = None):
+@timed("streak_card")
+def renderstreak_card(checkins: list[dict], moods: list | None = None, stats: dict | None = None):
     # ==============================
     # STREAK CARD CSS (REQUIRED)
     # ==============================
@@ -319,17 +575,23 @@ def renderstreak_card(checkins: list[dict], moods: list | None = None):
     gentle = st.toggle("Gentle streak mode (1-day grace)", value=True)
     grace = 1 if gentle else 0
 
-    streaks = compute_streaks(checkins, grace_days=grace)
-    wk, goal = week_progress(checkins, goal=5)
-
-    stats = mood_stats_7d(checkins)
+    if stats is not None:
+        # O(1): incrementally maintained by upsert_today_checkin
+        streaks = read_streaks(stats["streaks"], grace_days=grace)
+        wk, goal = week_count(stats["rollup"]), 5
+        recent = recent_stats(stats["rollup"])
+    else:
+        streaks = compute_streaks(checkins, grace_days=grace)
+        wk, goal = week_progress(checkins, goal=5)
+        recent = mood_stats_7d(checkins)
 
     avg_from_moods = avg_mood_level_7d_from_moods(moods) if moods else None
-    avg_level = avg_from_moods if avg_from_moods is not None else stats["avg_level"]
+    avg_level = avg_from_moods if avg_from_moods is not None else recent["avg_level"]
 
 
     today_iso = date.today().isoformat()
-    checked_today = any(c.get("date") == today_iso for c in checkins)
+    # history is kept sorted, so only the last record can be today's
+    checked_today = bool(checkins) and checkins[-1].get("date") == today_iso
 
     if "last_seen_checkin_date" not in st.session_state:
         st.session_state.last_seen_checkin_date = None
@@ -342,7 +604,7 @@ def renderstreak_card(checkins: list[dict], moods: list | None = None):
 
     avg = "-" if avg_level is None else f"{avg_level:.2f}"
 
-    top_word = stats["top_word"]
+    top_word = recent["top_word"]
 
     if streaks["current"] >= 7:
         vibe = "You’re on fire this week"
@@ -3,7 +3,7 @@ import streamlit as st
 import pandas as pd
 
 from mood_logic import mood_to_num
-from daily import calendar_heatmap
+from daily import calendar_heatmap, history_heatmap
 
 
 def _normalize_moods(moods: list):
@@ -25,13 +25,17 @@ def _normalize_moods(moods: list):
     return out
 
 
-def render_dashboard(moods: list, chat_count: int, checkins: list[dict]):
+def render_dashboard(moods: list, chat_count: int, checkins: list[dict], user: str | None = None, stats: dict | None = None):
     st.subheader("Here is your wellbeing overview!")
 
     # --- REPLACEMENT: heatmap instead of timeline graph ---
     st.write("### Your Check-in Map")
     st.caption("A simple view of your consistency over time (darker = higher mood level).")
-    calendar_heatmap(checkins, weeks=16)
+    calendar_heatmap(checkins, weeks=16, user=user, stats=stats)
+
+    with st.expander("Zoom out: your whole history"):
+        st.caption("Recent weeks day by day, older weeks and months as averages.")
+        history_heatmap(checkins, user=user, stats=stats)
 
     st.divider()
 
@@ -95,3 +99,31 @@ def render_dashboard(moods: list, chat_count: int, checkins: list[dict]):
         st.write("You have started tracking your mood.")
     else:
         st.write("Start with one check-in. That is enough for today.")
+
+
+def render_perf_page(profiler):
+    """Admin view of the rerun profiler (QB_PROFILE=1): latency per page and block."""
+    st.subheader("Performance")
+    st.caption("Milliseconds per rerun, since this server started or the last reset. "
+               "\"rerun\" is the whole script, \"page\" the selected page's branch.")
+
+    rows = profiler.rows()
+    if not rows:
+        st.info("Nothing recorded yet. Use the app for a bit, then come back.")
+        return
+
+    df = pd.DataFrame(rows)
+    totals = df[df["block"] == "rerun"].sort_values("p95_ms", ascending=False)
+    if not totals.empty:
+        st.write("### Reruns by page")
+        st.dataframe(totals.drop(columns="block"), hide_index=True, use_container_width=True)
+
+    st.write("### Blocks")
+    pages = sorted(df["page"].unique())
+    pick = st.selectbox("Page", ["All pages"] + pages)
+    view = df if pick == "All pages" else df[df["page"] == pick]
+    st.dataframe(view.sort_values("p95_ms", ascending=False), hide_index=True, use_container_width=True)
+
+    if st.button("Reset timings", type="secondary"):
+        profiler.reset()
+        st.rerun()
@@ -0,0 +1,30 @@
+import threading
+
+# ==============================
+# CHANGE VERSIONS FOR SHARED STATE
+# ==============================
+# Writers bump a topic ("lobby", "match:<id>", ...) whenever they change
+# what viewers of that topic would see. Viewers remember the versions they
+# rendered and only rerun the full page when one of them moves.
+
+
+class VersionBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: dict[str, int] = {}
+
+    def bump(self, *topics: str) -> None:
+        with self._lock:
+            for t in topics:
+                self._versions[t] = self._versions.get(t, 0) + 1
+
+    def version(self, topic: str) -> int:
+        return self._versions.get(topic, 0)
+
+    def snapshot(self, topics) -> tuple:
+        return tuple(self._versions.get(t, 0) for t in topics)
+
+    def forget(self, topic: str) -> None:
+        # drop counters for things that no longer exist (archived matches)
+        with self._lock:
+            self._versions.pop(topic, None)
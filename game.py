@@ -1,15 +1,42 @@
+import copy
+import heapq
+import json
+import multiprocessing
 import time
 import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
 import streamlit as st
-from streamlit_autorefresh import st_autorefresh
 
 
-from wallet import get_user_wallet, save_wallets
+from wallet import get_user_wallet, add_trophies
+from events import VersionBus
+from backend import MemoryBackend
+import bitboard
+import c4bot
 
-ROWS, COLS = 6, 7
+ROWS, COLS = bitboard.ROWS, bitboard.COLS
 AFK_SECONDS = 60
-AUTO_RERUN_EVERY = 2  # seconds
+AUTO_RERUN_EVERY = 2  # seconds between cheap change checks (not full reruns)
 LOBBY_TTL_SECONDS = 30  # consider 30–60; 30 feels responsive
+LOBBY_NAMES_SHOWN = 50
+MATCH_GRACE_SECONDS = 120  # finished/abandoned matches stay visible this long
+MATCH_ARCHIVE_PATH = Path("match_archive.jsonl")
+
+# Matchmaking: players are queued by trophy band; the longer someone waits,
+# the further away (in bands) they accept an opponent.
+TROPHY_BAND = 20            # trophies per band (0 = one plain FIFO queue)
+WIDEN_EVERY_SECONDS = 10    # each 10s of waiting accepts one more band away
+MAX_BAND_RADIUS = 5         # ...after which anyone waiting will do
+
+# Built-in opponent for when nobody else is around (no trophies either way)
+BOT_NAME = "QuietBot"
+
+# Post-game analysis runs in worker processes so the solver never holds up a rerun
+ANALYSIS_WORKERS = 2
+ANALYSIS_POLL_SECONDS = 1
 
 
 EMPTY, P1, P2 = 0, 1, 2
@@ -20,76 +47,440 @@ TOK = {EMPTY: "⚪", P1: "🔴", P2: "🟡"}
 def _ensure_game_keys(SHARED: dict):
     if not isinstance(SHARED.get("lobby"), dict):
         SHARED["lobby"] = {}
-
-    SHARED.setdefault("matches", [])
+    if "lobby_heap" not in SHARED:
+        # presence expiry: one (due_ts, user) heap entry per lobby user
+        SHARED["lobby_due"] = dict(SHARED["lobby"])
+        SHARED["lobby_heap"] = [(t, u) for u, t in SHARED["lobby"].items()]
+        heapq.heapify(SHARED["lobby_heap"])
+
+    # matches are indexed by id (older servers kept a list)
+    if isinstance(SHARED.get("matches"), list):
+        SHARED["matches"] = {m["id"]: m for m in SHARED["matches"]}
+    SHARED.setdefault("matches", {})
     SHARED.setdefault("match_of", {})
     SHARED.setdefault("games", {})
+    SHARED.setdefault("match_ended", {})  # match_id -> time it finished / was abandoned
+    SHARED.setdefault("mm_bands", {})     # band -> deque[(user, joined)] (stale entries skipped lazily)
+    SHARED.setdefault("mm_waiting", {})   # user -> (band, joined) for everyone queued
+    SHARED.setdefault("events", VersionBus())
+    if "backend" not in SHARED:  # locks, op log, presence (see backend.py)
+        SHARED["backend"] = MemoryBackend(state_dir=None, chat=SHARED.get("chat"))
+    SHARED.setdefault("analysis", {})     # game_id -> Future while running, then list of graded moves
+
+def _lock(SHARED: dict, name: str):
+    # names + order: see locks.py
+    return SHARED["backend"].lock(name)
+
+def _log(SHARED: dict, op: dict):
+    # append an op that is already applied here (other processes replay it)
+    SHARED["backend"].append(op)
+
+def _bump(SHARED: dict, *topics: str):
+    # tell viewers of these topics to rerun
+    SHARED["events"].bump(*topics)
+
+def _match_topic(match_id: str) -> str:
+    return f"match:{match_id}"
 
 def _new_match_id() -> str:
     return f"m_{int(time.time()*1000)}_{random.randint(1000,9999)}"
 
+def _new_game_id() -> str:
+    return f"g_{int(time.time()*1000)}_{random.randint(1000,9999)}"
+
 def _get_match(SHARED: dict, match_id: str):
-    for m in reversed(SHARED["matches"]):
-        if m["id"] == match_id:
-            return m
-    return None
+    return SHARED["matches"].get(match_id)
+
+def _end_match(SHARED: dict, match_id: str):
+    # start the grace period (first end wins; "play again" clears it)
+    with _lock(SHARED, "matchmaking"):
+        if match_id not in SHARED["match_ended"]:
+            SHARED["match_ended"][match_id] = time.time()
+            _log_match(SHARED, match_id, with_game=False)
+
+def _release_player(SHARED: dict, user: str):
+    # drop user's match link; a match nobody points at any more is abandoned
+    with _lock(SHARED, "matchmaking"):
+        match_id = SHARED["match_of"].pop(user, None)
+        if match_id is None:
+            return
+        m = SHARED["matches"].get(match_id)
+        if m is None or not any(SHARED["match_of"].get(p) == match_id for p in (m["a"], m["b"])):
+            _end_match(SHARED, match_id)
+        _log_match(SHARED, match_id, with_game=False)
+
+def _archive_match(match: dict, game: dict | None, ended: float):
+    rec = dict(match, ended=ended)
+    if game is not None:
+        rec.update(
+            winner=game.get("winner"),
+            moves=game.get("moves", 0),
+            cols=game.get("cols"),
+            board=game.get("board"),
+        )
+    with MATCH_ARCHIVE_PATH.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(rec) + "\n")
+
+def _gc_matches(SHARED: dict):
+    """
+    Archive + forget matches that ended more than MATCH_GRACE_SECONDS ago.
+    Only ended matches are looked at, so live games cost nothing here and
+    memory is bounded by the number of live games.
+    """
+    ended = SHARED["match_ended"]
+    if not ended:
+        return
+    now = time.time()
+    gone = []
+    with _lock(SHARED, "matchmaking"):
+        for match_id, t in list(ended.items()):
+            if now - t < MATCH_GRACE_SECONDS:
+                continue
+            del ended[match_id]
+            match = SHARED["matches"].pop(match_id, None)
+            game = SHARED["games"].pop(match_id, None)
+            _drop_analysis(SHARED, game)
+            if match is None:
+                continue
+            for p in (match["a"], match["b"]):
+                if SHARED["match_of"].get(p) == match_id:
+                    SHARED["match_of"].pop(p, None)
+            _log_match(SHARED, match_id)
+            gone.append((match, game, t))
+
+    # file I/O outside the lock; nobody can reach these matches any more
+    for match, game, t in gone:
+        try:
+            _archive_match(match, game, t)
+        except OSError:
+            pass  # archiving is best effort; never block the page
+        topic = _match_topic(match["id"])
+        _bump(SHARED, "lobby", topic)
+        SHARED["events"].forget(topic)
+        SHARED["backend"].forget_lock(topic)
 
 def _in_lobby(SHARED: dict, user: str) -> bool:
     return user in SHARED["lobby"]
 
+def _lobby_add(SHARED: dict, user: str, at: float):
+    # caller holds "lobby"; lobby maps user -> join time (in join order)
+    SHARED["lobby"][user] = at
+    if user not in SHARED["lobby_due"]:
+        SHARED["lobby_due"][user] = at
+        heapq.heappush(SHARED["lobby_heap"], (at, user))
+
+def _lobby_remove(SHARED: dict, user: str) -> bool:
+    # caller holds "lobby"; the heap entry goes stale and is skipped later
+    SHARED["lobby_due"].pop(user, None)
+    return SHARED["lobby"].pop(user, None) is not None
+
 def _touch_lobby(SHARED: dict, user: str):
-    # heartbeat (mark user as online "now")
-    SHARED["lobby"][user] = time.time()
+    # heartbeat (mark user as online "now"); O(1) — the heap entry is only
+    # pushed on join and lazily moved forward when it comes due
+    now = time.time()
+    SHARED["backend"].heartbeat(user, now)
+    if user in SHARED["lobby"]:
+        return
+    with _lock(SHARED, "lobby"):
+        if user not in SHARED["lobby"]:
+            _lobby_add(SHARED, user, now)
+            _log(SHARED, {"op": "lobby_join", "user": user, "at": now})
 
-def _join_lobby(SHARED: dict, user: str):
+def _join_lobby(SHARED: dict, wallets, user: str):
     _touch_lobby(SHARED, user)
+    _bump(SHARED, "lobby")
+    _enqueue(SHARED, wallets, user)
 
 def _leave_lobby(SHARED: dict, user: str):
-    SHARED["lobby"].pop(user, None)
-    SHARED["match_of"].pop(user, None)
+    with _lock(SHARED, "lobby"):
+        if _lobby_remove(SHARED, user):
+            _log(SHARED, {"op": "lobby_leave", "user": user})
+        SHARED["backend"].drop_presence(user)
+        with _lock(SHARED, "matchmaking"):
+            _unqueue(SHARED, user)
+            _release_player(SHARED, user)
+    _bump(SHARED, "lobby")
+
+def _lobby_names(SHARED: dict, n: int) -> list[str]:
+    # lock-free copy: the "lobby" lock is a cross-process transaction with
+    # the sqlite backend, too much for every render. Another session may
+    # join/leave mid-copy (RuntimeError); just copy again.
+    while True:
+        try:
+            return list(islice(SHARED["lobby"], n))
+        except RuntimeError:
+            continue
 
 
 def _init_board():
-    return [[EMPTY for _ in range(COLS)] for _ in range(ROWS)]
+    # two 64-bit player masks + column heights (see bitboard.py)
+    return bitboard.new_board()
 
-def _make_match(SHARED: dict, a: str, b: str) -> str:
-    match_id = _new_match_id()
-    SHARED["matches"].append({"id": match_id, "a": a, "b": b, "time": time.time()})
-    SHARED["match_of"][a] = match_id
-    SHARED["match_of"][b] = match_id
-
-    # Connect 4 game state
-    SHARED["games"][match_id] = {
+def _new_game(first: str) -> dict:
+    return {
+        "id": _new_game_id(),
         "board": _init_board(),
-        "turn": a,            # a starts
+        "turn": first,        # a starts
         "winner": None,       # username or "draw"
         "scored": False,      # prevent double-awards
         "moves": 0,
-        "created": time.time()
+        "cols": [],           # columns in move order (for post-game analysis)
+        "created": time.time(),
+        "last_action": time.time(),
     }
+
+def _make_match(SHARED: dict, a: str, b: str) -> str:
+    match_id = _new_match_id()
+    match = {"id": match_id, "a": a, "b": b, "time": time.time()}
+    if b == BOT_NAME:
+        match["bot"] = True
+    with _lock(SHARED, "matchmaking"):
+        while match_id in SHARED["matches"]:  # same millisecond + suffix (e.g. in another process)
+            match_id = match["id"] = _new_match_id()
+        # Connect 4 game state first, so a match is never visible without its game
+        SHARED["games"][match_id] = _new_game(a)
+        SHARED["matches"][match_id] = match
+        for p in (a, b):
+            if p != BOT_NAME:  # the bot plays any number of games at once
+                SHARED["match_of"][p] = match_id
+        # (no match lock here: at worst a first move races into this record,
+        # and that move's own, later op carries the full state anyway)
+        _log_match(SHARED, match_id)
+    _bump(SHARED, "lobby")
     return match_id
 
-def _try_matchmake(SHARED: dict):
-    free = [u for u in SHARED["lobby"].keys() if u not in SHARED["match_of"]]
-    random.shuffle(free)
-    while len(free) >= 2:
-        a = free.pop()
-        b = free.pop()
-        _make_match(SHARED, a, b)
+# ---------- persistence ----------
+def _log_match(SHARED: dict, match_id: str, with_game: bool = True):
+    """
+    Append the match's current record to the backend's op log.
+    Ops carry whole records, so replaying one twice is harmless (journal.py).
+    Hold the match lock when with_game, and never call this while holding
+    "lobby" or "matchmaking" unless with_game is False or you created the match.
+    """
+    with _lock(SHARED, "matchmaking"):
+        match = SHARED["matches"].get(match_id)
+        if match is None:
+            _log(SHARED, {"op": "match_gone", "id": match_id})
+            return
+        op = {
+            "op": "match",
+            "id": match_id,
+            "match": match,
+            "ended": SHARED["match_ended"].get(match_id),
+            "linked": [p for p in (match["a"], match["b"]) if SHARED["match_of"].get(p) == match_id],
+        }
+        if with_game:
+            op["game"] = SHARED["games"].get(match_id)
+        _log(SHARED, op)
+
+def replay_game_op(SHARED: dict, op: dict):
+    """
+    Apply a logged lobby / queue / match op to SHARED: at startup, and in
+    a multi-process backend for every op another process logged.
+    """
+    _ensure_game_keys(SHARED)
+    kind = op["op"]
+    if kind in ("lobby_join", "lobby_leave"):
+        with _lock(SHARED, "lobby"):
+            if kind == "lobby_join":
+                if op["user"] not in SHARED["lobby"]:
+                    _lobby_add(SHARED, op["user"], op["at"])
+            else:
+                _lobby_remove(SHARED, op["user"])
+        _bump(SHARED, "lobby")
+        return
+    if kind in ("mm_wait", "mm_done"):
+        with _lock(SHARED, "matchmaking"):
+            SHARED["mm_waiting"].pop(op["user"], None)
+            if kind == "mm_wait":
+                _queue_add(SHARED, op["user"], op["band"], op["joined"])
+        return
+
+    match_id = op["id"]
+    with _lock(SHARED, "matchmaking"):
+        match = SHARED["matches"].get(match_id) if op["op"] == "match_gone" else op["match"]
+        if op["op"] == "match_gone":
+            SHARED["matches"].pop(match_id, None)
+            SHARED["games"].pop(match_id, None)
+            SHARED["match_ended"].pop(match_id, None)
+            linked = ()
+        else:
+            SHARED["matches"][match_id] = match
+            if op.get("game") is not None:
+                SHARED["games"][match_id] = op["game"]
+            if op.get("ended") is None:
+                SHARED["match_ended"].pop(match_id, None)
+            else:
+                SHARED["match_ended"][match_id] = op["ended"]
+            linked = op["linked"]
+        for p in (match["a"], match["b"]) if match else ():
+            if p in linked:
+                SHARED["match_of"][p] = match_id
+            elif SHARED["match_of"].get(p) == match_id:
+                SHARED["match_of"].pop(p, None)
+    _bump(SHARED, "lobby", _match_topic(match_id))
+
+def snapshot_game(SHARED: dict) -> list[dict]:
+    """Lobby, queue and every match as ops (JSON-able copies); replay them to restore."""
+    _ensure_game_keys(SHARED)
+    with _lock(SHARED, "lobby"):
+        out = [{"op": "lobby_join", "user": u, "at": at} for u, at in SHARED["lobby"].items()]
+        with _lock(SHARED, "matchmaking"):
+            for user, (band, joined) in SHARED["mm_waiting"].items():
+                out.append({"op": "mm_wait", "user": user, "band": band, "joined": joined})
+            for match_id, match in SHARED["matches"].items():
+                out.append({
+                    "op": "match",
+                    "id": match_id,
+                    "match": match,
+                    "game": SHARED["games"].get(match_id),
+                    "ended": SHARED["match_ended"].get(match_id),
+                    "linked": [p for p in (match["a"], match["b"]) if SHARED["match_of"].get(p) == match_id],
+                })
+        return copy.deepcopy(out)
+
+# ---------- matchmaking queue ----------
+def _band_of(wallets, user: str) -> int:
+    if not TROPHY_BAND:
+        return 0
+    return int(get_user_wallet(wallets, user).get("trophies", 0)) // TROPHY_BAND
+
+def _radius(joined: float, now: float) -> int:
+    return min(MAX_BAND_RADIUS, int((now - joined) // WIDEN_EVERY_SECONDS))
+
+def _queue_add(SHARED: dict, user: str, band: int, joined: float):
+    # caller holds "matchmaking"
+    SHARED["mm_waiting"][user] = (band, joined)
+    SHARED["mm_bands"].setdefault(band, deque()).append((user, joined))
+
+def _unqueue(SHARED: dict, user: str):
+    # caller holds "matchmaking"
+    if SHARED["mm_waiting"].pop(user, None) is not None:
+        _log(SHARED, {"op": "mm_done", "user": user})
+
+def _queue_head(SHARED: dict, band: int):
+    # oldest still-valid (user, joined) in a band; drops stale entries on the way
+    q = SHARED["mm_bands"].get(band)
+    while q:
+        user, joined = q[0]
+        if SHARED["mm_waiting"].get(user) == (band, joined):
+            return user, joined
+        q.popleft()
+    SHARED["mm_bands"].pop(band, None)
+    return None
+
+def _find_partner(SHARED: dict, me: str, band: int, radius: int, now: float):
+    """
+    Nearest band first; a pair is allowed if either player has waited long
+    enough to accept that distance. Looks at one queue head per band, so
+    this is O(MAX_BAND_RADIUS), independent of the lobby size.
+    Once either side is at MAX_BAND_RADIUS, anyone will do: the oldest
+    waiting player in any band (O(bands)), so no gap is too big to pair.
+    """
+    for dist in range(MAX_BAND_RADIUS + 1):
+        best = None
+        for b in {band - dist, band + dist}:
+            head = _queue_head(SHARED, b)
+            if head is None or head[0] == me:
+                continue
+            if dist <= max(radius, _radius(head[1], now)) and (best is None or head[1] < best[1]):
+                best = head
+        if best is not None:
+            return best[0]
+
+    oldest = None
+    for b in list(SHARED["mm_bands"]):  # _queue_head may drop emptied bands
+        head = _queue_head(SHARED, b)
+        if head is not None and head[0] != me and (oldest is None or head[1] < oldest[1]):
+            oldest = head
+    if oldest is not None and max(radius, _radius(oldest[1], now)) >= MAX_BAND_RADIUS:
+        return oldest[0]
+    return None
+
+def _pair(SHARED: dict, waited: str, newcomer: str):
+    # caller holds "matchmaking": both players leave the queue and get the match atomically
+    _unqueue(SHARED, waited)
+    _unqueue(SHARED, newcomer)
+    _make_match(SHARED, waited, newcomer)  # whoever waited longer moves first
+
+def _enqueue(SHARED: dict, wallets, user: str, only_if_idle: bool = False, radius: int = 0):
+    """
+    Matchmaking happens here, once per join: pair now or wait in the queue.
+    only_if_idle: leave a user who is already queued where they are.
+    radius: bands this user accepts right away (MAX_BAND_RADIUS = anyone).
+    """
+    band = _band_of(wallets, user)  # ledger read, outside our lock
+    with _lock(SHARED, "matchmaking"):
+        if user in SHARED["match_of"]:
+            return
+        if only_if_idle and user in SHARED["mm_waiting"]:
+            return
+        now = time.time()
+        _unqueue(SHARED, user)
+
+        partner = _find_partner(SHARED, user, band, radius, now)
+        if partner is not None:
+            _pair(SHARED, partner, user)
+            return
+        _queue_add(SHARED, user, band, now)
+        _log(SHARED, {"op": "mm_wait", "user": user, "band": band, "joined": now})
+
+def _widen_search(SHARED: dict, user: str):
+    # called from the waiting player's own heartbeat, never per viewer
+    if user not in SHARED["mm_waiting"]:
+        return  # unlocked peek; the real check is below
+    with _lock(SHARED, "matchmaking"):
+        entry = SHARED["mm_waiting"].get(user)
+        if entry is None:
+            return
+        band, joined = entry
+        now = time.time()
+        radius = _radius(joined, now)
+        if radius == 0:
+            return
+        partner = _find_partner(SHARED, user, band, radius, now)
+        if partner is not None:
+            waited, newcomer = (user, partner) if joined <= SHARED["mm_waiting"][partner][1] else (partner, user)
+            _pair(SHARED, waited, newcomer)
 
 def _prune_lobby(SHARED: dict):
+    """
+    Expire users not seen for LOBBY_TTL_SECONDS.
+    Only heap entries that are due get popped: an entry whose user has
+    heartbeated since is pushed back with the newer time, one that is stale
+    (user left) is dropped, and the rest expire. Cost is proportional to
+    what actually came due, not to the lobby size.
+    """
     now = time.time()
-    lobby = SHARED["lobby"]
-
-    # remove people not seen recently
-    for u, last_seen in list(lobby.items()):
-        if now - float(last_seen) > LOBBY_TTL_SECONDS:
-            del lobby[u]
-
-    # also clean match_of entries for users who are no longer in lobby
-    for u in list(SHARED["match_of"].keys()):
-        if u not in lobby:
-            SHARED["match_of"].pop(u, None)
+    backend = SHARED["backend"]
+    heap = SHARED["lobby_heap"]
+    due = SHARED["lobby_due"]
+    changed = False
+    if not heap or now - heap[0][0] <= LOBBY_TTL_SECONDS:
+        return  # nothing due: the common case costs no lock at all
+
+    with _lock(SHARED, "lobby"):
+        while heap and now - heap[0][0] > LOBBY_TTL_SECONDS:
+            ts, u = heapq.heappop(heap)
+            if due.get(u) != ts:
+                continue  # stale entry (left, or already rescheduled)
+            last_seen = backend.last_seen(u)  # heartbeats from any server process
+            if last_seen is not None and now - float(last_seen) <= LOBBY_TTL_SECONDS:
+                due[u] = last_seen
+                heapq.heappush(heap, (last_seen, u))
+                continue
+
+            # not seen recently: drop from lobby, queue and match
+            if _lobby_remove(SHARED, u):
+                _log(SHARED, {"op": "lobby_leave", "user": u})
+            backend.drop_presence(u)
+            with _lock(SHARED, "matchmaking"):
+                _unqueue(SHARED, u)
+                _release_player(SHARED, u)
+            changed = True
+
+    if changed:
+        _bump(SHARED, "lobby")
 
 def _render_lamps(n: int):
     max_icons = 30
@@ -102,38 +493,14 @@ def _render_lamps(n: int):
     )
 
 def _drop_piece(board, col, token):
-    # return (row, col) placed, or None if column full
-    for r in range(ROWS - 1, -1, -1):
-        if board[r][col] == EMPTY:
-            board[r][col] = token
-            return (r, col)
-    return None
-
-def _in_bounds(r, c):
-    return 0 <= r < ROWS and 0 <= c < COLS
+    # return (row, col) placed, or None if column full; O(1) via column heights
+    return bitboard.drop(board, col, token)
 
 def _check_winner(board, last_r, last_c):
-    token = board[last_r][last_c]
+    token = bitboard.cell(board, last_r, last_c)
     if token == EMPTY:
         return False
-
-    directions = [(0,1), (1,0), (1,1), (1,-1)]
-    for dr, dc in directions:
-        count = 1
-        # forward
-        r, c = last_r + dr, last_c + dc
-        while _in_bounds(r, c) and board[r][c] == token:
-            count += 1
-            r, c = r + dr, c + dc
-        # backward
-        r, c = last_r - dr, last_c - dc
-        while _in_bounds(r, c) and board[r][c] == token:
-            count += 1
-            r, c = r - dr, c - dc
-
-        if count >= 4:
-            return True
-    return False
+    return bitboard.is_winner(board, token)
 
 def _board_full(moves: int):
     return moves >= ROWS * COLS
@@ -142,7 +509,7 @@ def _render_board(board):
     # Simple clean board render
     lines = []
     for r in range(ROWS):
-        lines.append(" ".join(TOK[board[r][c]] for c in range(COLS)))
+        lines.append(" ".join(TOK[bitboard.cell(board, r, c)] for c in range(COLS)))
     st.markdown(
         "<div style='font-size:28px; line-height:1.35; text-align:center;'>"
         + "<br>".join(lines)
@@ -153,19 +520,17 @@ def _render_board(board):
 
 def _award_trophies(wallets, winner: str, loser: str):
     # +10 winner, -4 loser (clamp at 0)
-    w_win = get_user_wallet(wallets, winner)
-    w_lose = get_user_wallet(wallets, loser)
+    add_trophies(wallets, winner, 10)
+    add_trophies(wallets, loser, -4)
 
-    w_win["trophies"] = int(w_win.get("trophies", 0)) + 10
-    w_lose["trophies"] = max(0, int(w_lose.get("trophies", 0)) - 4)
-
-    save_wallets(wallets)
+def _trophies(wallets, user: str):
+    if user == BOT_NAME:
+        return "—"
+    return int(get_user_wallet(wallets, user).get("trophies", 0))
 
 def _render_score(wallets, a: str, b: str, display_name_fn):
-    wa = get_user_wallet(wallets, a)
-    wb = get_user_wallet(wallets, b)
-    ta = int(wa.get("trophies", 0))
-    tb = int(wb.get("trophies", 0))
+    ta = _trophies(wallets, a)
+    tb = _trophies(wallets, b)
 
     c1, c2 = st.columns(2)
     with c1:
@@ -177,6 +542,147 @@ def _render_score(wallets, a: str, b: str, display_name_fn):
         st.write(f"🏆 Trophies: **{tb}**")
         st.write("🟡 Token")
 
+# ---------- moves + bot ----------
+def _apply_move(SHARED: dict, match: dict, game: dict, player: str, col: int) -> bool:
+    """
+    Drop player's token in col, then settle win / draw / next turn.
+    False if the column is full. Caller holds the match lock.
+    """
+    token = P1 if player == match["a"] else P2
+    placed = _drop_piece(game["board"], col, token)
+    if placed is None:
+        return False
+
+    game["moves"] += 1
+    game.setdefault("cols", []).append(col)
+    r, cc = placed
+    game["last_action"] = time.time()
+
+    # Win check
+    if _check_winner(game["board"], r, cc):
+        game["winner"] = player
+        _end_match(SHARED, match["id"])
+    elif _board_full(game["moves"]):
+        game["winner"] = "draw"
+        _end_match(SHARED, match["id"])
+    else:
+        # swap turn
+        game["turn"] = match["b"] if player == match["a"] else match["a"]
+    return True
+
+def _start_bot_match(SHARED: dict, me: str) -> str | None:
+    with _lock(SHARED, "matchmaking"):
+        if me in SHARED["match_of"]:
+            return None  # paired with a human meanwhile
+        _unqueue(SHARED, me)
+        return _make_match(SHARED, me, BOT_NAME)  # the human moves first
+
+def _bot_move(SHARED: dict, match: dict, game: dict):
+    # alpha-beta search under a fixed time budget (see c4bot.py), on a copy
+    # of the board and outside the match lock; dropped if the game moved on
+    if game["winner"] is not None or game["turn"] != BOT_NAME:
+        return
+    token = P1 if match["a"] == BOT_NAME else P2
+    moves = game["moves"]
+    col = c4bot.choose_move(copy.deepcopy(game["board"]), token)
+    if col is None:
+        return
+    with _lock(SHARED, _match_topic(match["id"])):
+        if SHARED["games"].get(match["id"]) is not game or game["moves"] != moves or game["winner"] is not None:
+            return
+        _apply_move(SHARED, match, game, BOT_NAME, col)
+        _log_match(SHARED, match["id"])
+
+# ---------- post-game analysis ----------
+@st.cache_resource
+def _analysis_pool() -> ProcessPoolExecutor:
+    # one pool per server, shared by every session. Spawned, not forked:
+    # a fork of the threaded server could inherit a lock another thread holds
+    return ProcessPoolExecutor(max_workers=ANALYSIS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+def _can_analyse(game: dict) -> bool:
+    # games from before move lists were recorded can't be replayed
+    return game["winner"] is not None and "id" in game and len(game.get("cols", [])) == game["moves"]
+
+def _request_analysis(SHARED: dict, game: dict):
+    # one job per game id, whoever asks first
+    with _lock(SHARED, "analysis"):
+        if game["id"] not in SHARED["analysis"]:
+            SHARED["analysis"][game["id"]] = _analysis_pool().submit(c4bot.analyse_game, list(game["cols"]))
+
+def _analysis_result(SHARED: dict, game: dict):
+    """(state, payload): ("none"|"running"|"done"|"failed", moves or error)."""
+    job = SHARED["analysis"].get(game.get("id"))
+    if job is None:
+        return "none", None
+    if isinstance(job, list):
+        return "done", job
+    if not job.done():
+        return "running", None
+    err = job.exception()
+    with _lock(SHARED, "analysis"):
+        if SHARED["analysis"].get(game["id"]) is not job:
+            return "none", None  # dropped meanwhile (play again / GC)
+        if err is not None:
+            SHARED["analysis"].pop(game["id"], None)  # allow a retry
+            return "failed", err
+        SHARED["analysis"][game["id"]] = job.result()  # keep the plain result, not the future
+        return "done", SHARED["analysis"][game["id"]]
+
+def _drop_analysis(SHARED: dict, game: dict | None):
+    with _lock(SHARED, "analysis"):
+        job = SHARED["analysis"].pop((game or {}).get("id"), None)
+    if job is not None and not isinstance(job, list):
+        job.cancel()
+
+@st.fragment(run_every=ANALYSIS_POLL_SECONDS)
+def _await_analysis(SHARED: dict, game: dict):
+    # cheap poll: a dict lookup + Future.done(); full rerun only once it finishes
+    state, _ = _analysis_result(SHARED, game)
+    if state != "running":
+        st.rerun()
+    st.caption("🔍 Analysing every move…")
+
+def _render_analysis(SHARED: dict, match: dict, game: dict, display_name_fn):
+    state, payload = _analysis_result(SHARED, game)
+    if state == "none":
+        if st.button("🔍 Analyse this game", key=f"c4_analyse_{game['id']}", use_container_width=True):
+            _request_analysis(SHARED, game)
+            st.rerun()
+        return
+    if state == "running":
+        _await_analysis(SHARED, game)
+        return
+    if state == "failed":
+        st.error(f"Analysis failed: {payload}")
+        return
+
+    players = {1: match["a"], 2: match["b"]}
+    marks = {"best": "✅", "ok": "👌", "blunder": "❌", "missed win": "⚠️"}
+    for n, user in players.items():
+        mine = [m for m in payload if m["player"] == n]
+        bad = sum(m["verdict"] in ("blunder", "missed win") for m in mine)
+        best = sum(m["verdict"] == "best" for m in mine)
+        st.caption(f"{TOK[n]} {display_name_fn(user)}: {best}/{len(mine)} best moves, {bad} blunder(s)")
+    with st.expander("Move by move"):
+        st.dataframe(
+            [
+                {
+                    "#": m["ply"],
+                    "Player": TOK[m["player"]],
+                    "Played": m["col"] + 1,
+                    "Best": m["best"] + 1,
+                    "Verdict": f"{marks[m['verdict']]} {m['verdict']}",
+                }
+                for m in payload
+            ],
+            hide_index=True,
+            use_container_width=True,
+        )
+
+def _with_bot_label(display_name_fn):
+    return lambda u: f"🤖 {BOT_NAME}" if u == BOT_NAME else display_name_fn(u)
+
 def _other(match: dict, me: str) -> str | None:
     if not isinstance(match, dict):
         return None
@@ -201,16 +707,77 @@ def _other(match: dict, me: str) -> str | None:
         return p1
     return None
 
-def render_connect4_page(SHARED: dict, me: str, display_name_fn):
+@st.fragment(run_every=AUTO_RERUN_EVERY)
+def _live_updates(SHARED: dict, me: str, topics: tuple, seen: tuple, match: dict | None, display_name_fn):
+    """
+    Reruns on its own every AUTO_RERUN_EVERY seconds without rerunning the
+    whole app: keeps my lobby heartbeat, ticks the AFK timer, and only asks
+    for a full rerun when a topic I'm viewing changed since I rendered it.
+    """
+    SHARED["backend"].sync()  # other server processes' changes bump topics too
+    if _in_lobby(SHARED, me):
+        _touch_lobby(SHARED, me)
+    _prune_lobby(SHARED)
+    _widen_search(SHARED, me)
+
+    game = SHARED["games"].get(match["id"]) if match else None
+
+    # -------------------------
+    # AFK TIMER (turn-based)
+    # -------------------------
+    if game is not None and game["winner"] is None:
+        now = time.time()
+        turn_last_action = game.get("last_action", now)
+        elapsed = now - float(turn_last_action)
+        turn_user = game["turn"]
+
+        # Forfeit if AFK too long (both players' timers see this; the lock picks one)
+        if elapsed >= AFK_SECONDS:
+            with _lock(SHARED, _match_topic(match["id"])):
+                forfeit = (
+                    SHARED["games"].get(match["id"]) is game
+                    and game["winner"] is None
+                    and game.get("last_action", turn_last_action) == turn_last_action
+                )
+                if forfeit:
+                    afk_loser = turn_user
+                    afk_winner = match["b"] if afk_loser == match["a"] else match["a"]
+                    game["winner"] = afk_winner
+                    _end_match(SHARED, match["id"])
+                    _log_match(SHARED, match["id"])
+            if forfeit:
+                _bump(SHARED, _match_topic(match["id"]))
+                st.toast(
+                    f"⏳ {display_name_fn(afk_loser)} was AFK. Forfeit!",
+                    icon="⏳",
+                )
+            st.rerun()
+
+        # Countdown display
+        remaining = max(0, int(AFK_SECONDS - elapsed))
+        st.caption(
+            f"AFK timer: **{remaining}s** left for "
+            f"{display_name_fn(turn_user)} to move."
+        )
+
+    if SHARED["events"].snapshot(topics) != seen:
+        st.rerun()
+
+def render_connect4_page(SHARED: dict, wallets, me: str, display_name_fn):
+    display_name_fn = _with_bot_label(display_name_fn)
     _ensure_game_keys(SHARED)
     _prune_lobby(SHARED)
-    st_autorefresh(interval=AUTO_RERUN_EVERY * 1000, key="connect4_refresh")
+    _gc_matches(SHARED)
 
-    
     # If I'm in lobby, refresh heartbeat
     if _in_lobby(SHARED, me):
         _touch_lobby(SHARED, me)
 
+    # versions are taken before the state they cover is read: a change that
+    # lands in between then shows up as new and reruns us, never as seen
+    events = SHARED["events"]
+    lobby_seen = events.version("lobby")
+
     st.subheader("Connect Four")
     st.caption("Join the lobby to be matched. Winner +10 🏆, loser −4 🏆.")
 
@@ -223,46 +790,57 @@ def render_connect4_page(SHARED: dict, me: str, display_name_fn):
                 st.rerun()
         else:
             if st.button("Join lobby", use_container_width=True):
-                _join_lobby(SHARED, me)
+                _join_lobby(SHARED, wallets, me)
                 st.rerun()
 
     st.divider()
 
-    # Lobby display
-    online = sorted(SHARED["lobby"].keys())
-    n = len(online)
+    # Lobby display (len() of the presence dict is the live count)
+    n = len(SHARED["lobby"])
     
     st.markdown("### Players online")
     st.markdown(f"## **{n}** in lobby")
     _render_lamps(n)
     
-    if online:
+    if n:
         with st.expander("See who’s in the lobby", expanded=False):
-            for u in online:
+            # join order, capped so a huge lobby doesn't render thousands of rows
+            for u in _lobby_names(SHARED, LOBBY_NAMES_SHOWN):
                 st.write(f"• {display_name_fn(u)}")
+            if n > LOBBY_NAMES_SHOWN:
+                st.caption(f"+{n - LOBBY_NAMES_SHOWN} more")
 
 
     st.divider()
 
-    # Matchmake each render
-    _try_matchmake(SHARED)
+    # back in the lobby without a match (e.g. last match was archived): queue again
+    if _in_lobby(SHARED, me) and me not in SHARED["match_of"] and me not in SHARED["mm_waiting"]:
+        _enqueue(SHARED, wallets, me, only_if_idle=True)
 
     match_id = SHARED["match_of"].get(me)
     if not match_id:
+        _live_updates(SHARED, me, ("lobby",), (lobby_seen,), None, display_name_fn)
         if _in_lobby(SHARED, me):
             st.info("Waiting for an opponent…")
             if st.button("Re-roll matchmaking", use_container_width=True):
-                SHARED["match_of"].pop(me, None)
-                _try_matchmake(SHARED)
+                _release_player(SHARED, me)
+                _enqueue(SHARED, wallets, me, radius=MAX_BAND_RADIUS)  # nearest first, else anyone waiting
                 st.rerun()
+            if st.button(f"🤖 Play {BOT_NAME} while you wait", use_container_width=True):
+                _start_bot_match(SHARED, me)
+                st.rerun()
+            st.caption("Bot games are just for fun — no trophies won or lost.")
         else:
             st.caption("Join the lobby to start.")
         return
 
+    match_seen = events.version(_match_topic(match_id))
     match = _get_match(SHARED, match_id)
     if not match:
         st.warning("Match not found (state reset). Rejoin lobby.")
-        SHARED["match_of"].pop(me, None)
+        with _lock(SHARED, "matchmaking"):
+            if SHARED["match_of"].get(me) == match_id:
+                SHARED["match_of"].pop(me, None)
         return
 
     a, b = match["a"], match["b"]
@@ -270,71 +848,37 @@ def render_connect4_page(SHARED: dict, me: str, display_name_fn):
 
     st.success(f"Matched! You ↔ **{display_name_fn(other)}**")
 
-    # Need wallets from app session_state
-    wallets = st.session_state.get("wallets")
-    if wallets is None:
-        st.error("Wallets not loaded in session_state. Make sure app.py sets st.session_state.wallets.")
-        return
-
     _render_score(wallets, a, b, display_name_fn)
     st.divider()
 
     # Game state
     game = SHARED["games"].get(match_id)
     if not game:
-        SHARED["games"][match_id] = {
-            "board": _init_board(),
-            "turn": a,
-            "winner": None,
-            "scored": False,
-            "moves": 0,
-            "created": time.time(),
-            "last_action": time.time(),
-        }
-
-    game = SHARED["games"][match_id]
+        with _lock(SHARED, "matchmaking"):
+            game = SHARED["games"].setdefault(match_id, _new_game(a))
 
     board = game["board"]
-        # -------------------------
-    # AFK TIMER (turn-based)
-    # -------------------------
-    now = time.time()
 
-    if game["winner"] is None:
-        elapsed = now - float(game.get("last_action", now))
-        turn_user = game["turn"]
-
-        # Forfeit if AFK too long
-        if elapsed >= AFK_SECONDS:
-            afk_loser = turn_user
-            afk_winner = b if afk_loser == a else a
-            game["winner"] = afk_winner
-            st.toast(
-                f"⏳ {display_name_fn(afk_loser)} was AFK. Forfeit!",
-                icon="⏳",
-            )
-            st.rerun()
+    # live updates: heartbeat, AFK countdown, rerun when lobby/match changes
+    _live_updates(SHARED, me, ("lobby", _match_topic(match_id)), (lobby_seen, match_seen), match, display_name_fn)
 
-        # Countdown display
-        remaining = max(0, int(AFK_SECONDS - elapsed))
-        if game["winner"] is None:
-            st.caption(
-                f"AFK timer: **{remaining}s** left for "
-                f"{display_name_fn(turn_user)} to move."
-            )
 
-
-    # Winner / awards (once)
+    # Winner / awards (once; both players' pages get here, the match lock picks one)
     if game["winner"] and not game["scored"]:
-        if game["winner"] != "draw":
-            winner = game["winner"]
-            loser = b if winner == a else a
-            _award_trophies(wallets, winner, loser)
+        with _lock(SHARED, _match_topic(match_id)):
+            # a game replaced meanwhile (play again, another process's op) is left to the next rerun
+            award = SHARED["games"].get(match_id) is game and not game["scored"]
             game["scored"] = True
+            if award and game["winner"] != "draw" and not match.get("bot"):  # bot games: trophies untouched
+                winner = game["winner"]
+                loser = b if winner == a else a
+                _award_trophies(wallets, winner, loser)
+            else:
+                award = False
+            _log_match(SHARED, match_id)  # persist "scored" so a restart can't award twice
+        if award:
             st.toast(f"🏆 {display_name_fn(winner)} wins! +10 trophies", icon="🏆")
             st.toast(f"{display_name_fn(loser)} loses −4 trophies", icon="⚠️")
-        else:
-            game["scored"] = True
 
     # Status
     if game["winner"] == "draw":
@@ -360,47 +904,43 @@ def render_connect4_page(SHARED: dict, me: str, display_name_fn):
     for c in range(COLS):
         with cols[c]:
             if st.button(f"{c+1}", key=f"c4_{match_id}_{c}", use_container_width=True, disabled=disabled):
-                # Apply move
-                token = P1 if me == a else P2
-                placed = _drop_piece(board, c, token)
-                if placed is None:
-                    st.warning("That column is full. Pick another.")
-                    st.rerun()
-
-                game["moves"] += 1
-                r, cc = placed
-                game["last_action"] = time.time()
-
-
-                # Win check
-                if _check_winner(board, r, cc):
-                    game["winner"] = me
-                elif _board_full(game["moves"]):
-                    game["winner"] = "draw"
-                else:
-                    # swap turn
-                    game["turn"] = other
-
+                with _lock(SHARED, _match_topic(match_id)):
+                    # recheck under the lock: the page may be stale (reset, forfeit, double click)
+                    if SHARED["games"].get(match_id) is not game or game["winner"] is not None or game["turn"] != me:
+                        st.rerun()
+
+                    # Apply move
+                    if not _apply_move(SHARED, match, game, me, c):
+                        st.warning("That column is full. Pick another.")
+                        st.rerun()
+                    _log_match(SHARED, match_id)
+
+                # bot answers right away (bounded by its time budget)
+                if match.get("bot"):
+                    _bot_move(SHARED, match, game)
+                _bump(SHARED, _match_topic(match_id))
                 st.rerun()
 
     # Controls after game ends
     if game["winner"] is not None:
+        if _can_analyse(game):
+            _render_analysis(SHARED, match, game, display_name_fn)
         cA, cB = st.columns(2)
         with cA:
             if st.button("Play again (same opponent)", use_container_width=True):
-                SHARED["games"][match_id] = {
-                    "board": _init_board(),
-                    "turn": a,
-                    "winner": None,
-                    "scored": False,
-                    "moves": 0,
-                    "created": time.time(),
-                    "last_action": time.time(),
-                }
+                with _lock(SHARED, _match_topic(match_id)):
+                    # only the first click resets; the second sees the new game
+                    if SHARED["games"].get(match_id) is game:
+                        with _lock(SHARED, "matchmaking"):
+                            SHARED["games"][match_id] = _new_game(a)
+                            SHARED["match_ended"].pop(match_id, None)
+                        _log_match(SHARED, match_id)
+                        _drop_analysis(SHARED, game)
+                _bump(SHARED, _match_topic(match_id))
                 st.rerun()
 
         with cB:
             if st.button("Rematch (leave + rejoin)", use_container_width=True):
                 _leave_lobby(SHARED, me)
-                _join_lobby(SHARED, me)
+                _join_lobby(SHARED, wallets, me)
                 st.rerun()
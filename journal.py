@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+# ==============================
+# SNAPSHOT + OPERATION LOG
+# ==============================
+# Durable storage for shared server state (board, matches):
+#
+#   state/snapshot.json          {"lsn": n, "state": {...}}  everything up to op n
+#   state/ops-<first_lsn>.jsonl  one JSON op per line, each with its "lsn"
+#
+# Writers append small ops as they happen. Every SNAPSHOT_EVERY ops a
+# compact snapshot is written (tmp file + rename, so a crash leaves the old
+# one intact) and log segments it fully covers are deleted. Startup loads
+# the snapshot and replays only the ops after it.
+#
+# Snapshots are taken while writers keep going, which is safe because of
+# two rules for writers: apply an op in memory *before* appending it, and
+# make ops idempotent (carry ids / whole records), so replaying an op the
+# snapshot already contains changes nothing.
+
+STATE_DIR = Path("state")
+SNAPSHOT_EVERY = 5000  # ops between snapshots
+
+
+class Journal:
+    def __init__(self, state_dir: Path = STATE_DIR, snapshot_every: int = SNAPSHOT_EVERY):
+        self.dir = Path(state_dir)
+        self.snapshot_every = snapshot_every
+        self._lock = threading.Lock()
+        self._snapshotting = False
+        self.lsn = 0           # last op written
+        self.snapshot_lsn = 0  # last op covered by the snapshot on disk
+        self._log = None       # open segment
+
+    # ---------- disk ----------
+    def _snapshot_path(self) -> Path:
+        return self.dir / "snapshot.json"
+
+    def _segments(self) -> list[tuple[int, Path]]:
+        if not self.dir.exists():
+            return []
+        out = []
+        for p in self.dir.glob("ops-*.jsonl"):
+            first = p.stem[4:]
+            if first.isdigit():
+                out.append((int(first), p))
+        return sorted(out)
+
+    def _open_segment(self) -> None:
+        # caller holds self._lock
+        if self._log is not None:
+            self._log.close()
+        self.dir.mkdir(parents=True, exist_ok=True)
+        path = self.dir / f"ops-{self.lsn + 1:012d}.jsonl"
+        self._log = path.open("a", encoding="utf-8")
+
+    # ---------- startup ----------
+    def load(self) -> tuple[dict | None, list[dict]]:
+        """
+        (snapshot state or None, ops logged after it, oldest first).
+        Call once, before the first append.
+        """
+        state = None
+        path = self._snapshot_path()
+        if path.exists():
+            snap = json.loads(path.read_text(encoding="utf-8"))
+            state = snap["state"]
+            self.snapshot_lsn = self.lsn = int(snap["lsn"])
+
+        tail = []
+        segments = self._segments()
+        for i, (first, seg) in enumerate(segments):
+            nxt = segments[i + 1][0] if i + 1 < len(segments) else None
+            if nxt is not None and nxt <= self.snapshot_lsn + 1:
+                continue  # whole segment is inside the snapshot
+            with seg.open(encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except ValueError:
+                        break  # torn last line after a crash
+                    if op["lsn"] > self.lsn:
+                        tail.append(op)
+                        self.lsn = op["lsn"]
+
+        with self._lock:
+            self._open_segment()
+        return state, tail
+
+    # ---------- writes ----------
+    def append(self, op: dict) -> int:
+        """Log one op (a JSON-able dict); returns its lsn."""
+        with self._lock:
+            if self._log is None:
+                self._open_segment()
+            self.lsn += 1
+            self._log.write(json.dumps(dict(op, lsn=self.lsn), ensure_ascii=False) + "\n")
+            self._log.flush()
+            return self.lsn
+
+    def snapshot_due(self) -> bool:
+        return not self._snapshotting and self.lsn - self.snapshot_lsn >= self.snapshot_every
+
+    def begin_snapshot(self) -> int | None:
+        """
+        Start a new log segment and return the lsn that a state copy taken
+        from now on is guaranteed to cover, or None if another snapshot is
+        already being written.
+        """
+        with self._lock:
+            if self._snapshotting:
+                return None
+            self._snapshotting = True
+            self._open_segment()
+            return self.lsn
+
+    def write_snapshot(self, lsn: int, state: dict) -> None:
+        """Persist state as of lsn, then drop the log segments it covers."""
+        try:
+            path = self._snapshot_path()
+            tmp = path.with_suffix(".tmp")
+            with tmp.open("w", encoding="utf-8") as f:
+                json.dump({"lsn": lsn, "state": state}, f, ensure_ascii=False, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+            self.snapshot_lsn = lsn
+            for first, seg in self._segments():
+                if first <= lsn:
+                    seg.unlink(missing_ok=True)  # segments start at lsn + 1 after begin_snapshot
+        finally:
+            self._snapshotting = False
+
+    def close(self) -> None:
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
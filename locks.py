@@ -0,0 +1,41 @@
+import threading
+
+# ==============================
+# NAMED LOCKS FOR SHARED STATE
+# ==============================
+# Each session runs on its own thread, so every mutable piece of SHARED is
+# guarded by its own lock instead of one big one:
+#
+#   "match:<id>"   one game record (moves, winner, scoring, play again)
+#   "lobby"        presence: lobby, lobby_due, lobby_heap
+#   "matchmaking"  mm_bands, mm_waiting, matches, match_of, match_ended
+#   "analysis"     post-game analysis jobs
+#
+# Chat, the community board, the wallet ledger and the VersionBus carry
+# their own locks.
+# MemoryBackend hands these out; SQLiteBackend maps every name to one
+# section that is also exclusive across server processes (backend.py).
+# Always acquire in the order listed above (a match lock may be held while
+# taking "lobby", never the other way round) so two threads can't deadlock.
+# Locks are re-entrant: helpers can lock even when their caller already did.
+
+
+class LockTable:
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks: dict[str, threading.RLock] = {}
+
+    def __call__(self, name: str) -> threading.RLock:
+        lock = self._locks.get(name)
+        if lock is None:
+            with self._guard:
+                lock = self._locks.setdefault(name, threading.RLock())
+        return lock
+
+    def forget(self, name: str) -> None:
+        # drop locks for things that no longer exist (archived matches)
+        with self._guard:
+            self._locks.pop(name, None)
+
+    def __len__(self) -> int:
+        return len(self._locks)
@@ -26,6 +26,15 @@ def simple_insight(moods_count: int, chats_count: int) -> str:
     return "Small check-ins still matter."
 
 
+# The Mood Meter shown on the home page: high to low energy, top to bottom
+MOOD_GRID = [
+    ["Excited", "Joyful", "Motivated", "Inspired"],
+    ["Tense",   "Alert",  "Engaged",   "Proud"],
+    ["Sad",     "Calm",   "Content",   "Peaceful"],
+    ["Drained", "Tired",  "Restful",   "Serene"],
+]
+
+
 WORD_TO_MODE = {
     "Tense": "Overwhelmed",
     "Alert": "Overwhelmed",
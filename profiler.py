@@ -0,0 +1,144 @@
+import functools
+import hmac
+import math
+import os
+import threading
+from time import perf_counter
+
+# ==============================
+# PER-RERUN PAGE PROFILER (OPT-IN)
+# ==============================
+# QB_PROFILE=1 times every rerun, each page branch and the blocks inside
+# it (streak card, heatmaps, board, check-in/wallet loads and saves), and
+# keeps a latency histogram per (page, block). The admin page in
+# dashboard.render_perf_page shows p50/p95/p99 from them; it is listed
+# only for sessions opened once with ?admin=<QB_ADMIN_KEY>, since its
+# reset clears the timings for everyone.
+#
+# Disabled (the default), @timed hands back the undecorated function and
+# start()/stop() are a single flag check, so the app pays next to nothing.
+#
+# Timings go to the page the current rerun is on: each Streamlit rerun
+# runs in its own thread, so begin()/set_page() keep it thread-local.
+# Reruns cut short by st.rerun()/st.stop() keep the blocks they finished
+# but never record their page total.
+
+ENABLED = os.environ.get("QB_PROFILE", "").lower() not in ("", "0", "false", "no")
+ADMIN_KEY = os.environ.get("QB_ADMIN_KEY", "")  # unset: nobody sees the admin page
+
+# log-spaced buckets: 10 µs .. ~2 min at 5% resolution, so percentiles
+# are within 5% and memory is fixed however many reruns are recorded
+_MIN_MS = 0.01
+_GROWTH = 1.05
+_BUCKETS = 340
+_LOG_GROWTH = math.log(_GROWTH)
+
+OTHER_PAGE = "(other)"  # before the page is known, or off the script thread
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * _BUCKETS
+        self.n = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms: float) -> None:
+        i = 0 if ms <= _MIN_MS else min(_BUCKETS - 1, int(math.log(ms / _MIN_MS) / _LOG_GROWTH) + 1)
+        self.counts[i] += 1
+        self.n += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def quantile(self, q: float) -> float:
+        """Upper edge of the bucket holding the q-th sample (never above the max)."""
+        if not self.n:
+            return 0.0
+        rank = max(1, math.ceil(q * self.n))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(self.max_ms, _MIN_MS * _GROWTH ** i)
+        return self.max_ms
+
+
+class Profiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hists: dict[tuple[str, str], Histogram] = {}
+        self._local = threading.local()
+
+    # ---------- current page ----------
+    def begin(self, page: str | None) -> None:
+        """Start of a rerun; page may be corrected later with set_page."""
+        self._local.page = page or OTHER_PAGE
+
+    def set_page(self, page: str) -> None:
+        self._local.page = page
+
+    # ---------- recording ----------
+    def add(self, block: str, ms: float) -> None:
+        key = (getattr(self._local, "page", OTHER_PAGE), block)
+        with self._lock:
+            h = self._hists.get(key)
+            if h is None:
+                h = self._hists[key] = Histogram()
+            h.add(ms)
+
+    def rows(self) -> list[dict]:
+        """One row per (page, block): count, mean, p50/p95/p99 and max in ms."""
+        with self._lock:
+            items = sorted(self._hists.items())
+            return [
+                {
+                    "page": page,
+                    "block": block,
+                    "count": h.n,
+                    "mean_ms": round(h.total_ms / h.n, 3),
+                    "p50_ms": round(h.quantile(0.50), 3),
+                    "p95_ms": round(h.quantile(0.95), 3),
+                    "p99_ms": round(h.quantile(0.99), 3),
+                    "max_ms": round(h.max_ms, 3),
+                }
+                for (page, block), h in items
+            ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._hists.clear()
+
+
+# one per server process (module state survives Streamlit reruns)
+PROFILER = Profiler()
+
+
+def is_admin_key(key: str | None) -> bool:
+    return bool(ADMIN_KEY) and key is not None and hmac.compare_digest(key.encode(), ADMIN_KEY.encode())
+
+
+def start() -> float:
+    return perf_counter() if ENABLED else 0.0
+
+
+def stop(block: str, t0: float) -> None:
+    if ENABLED:
+        PROFILER.add(block, (perf_counter() - t0) * 1000)
+
+
+def timed(block: str):
+    """Decorator: record each call under `block` (the function itself when disabled)."""
+    def deco(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                PROFILER.add(block, (perf_counter() - t0) * 1000)
+        return wrapper
+    return deco
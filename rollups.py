@@ -0,0 +1,76 @@
+from datetime import date, timedelta
+
+# ==============================
+# CHECK-IN ROLLUPS
+# ==============================
+# Small per-user summary that the streak card reads instead of rescanning
+# the whole history:
+#   weeks  {(iso_year, iso_week): check-in days}
+#   days   {date: (level, word)} for the 7 most recent days only
+#   last   latest check-in date (or None)
+# add_checkin keeps it current in O(1); reads touch at most 7 day buckets.
+
+RECENT_DAYS = 7
+
+
+def new_rollup() -> dict:
+    return {"weeks": {}, "days": {}, "last": None}
+
+
+def add_checkin(rollup: dict, rec: dict) -> None:
+    """Fold one check-in record in. Re-adding a day replaces its old entry."""
+    d = rec.get("date")
+    if not d:
+        return
+    day = date.fromisoformat(d)
+    level = int(rec.get("level", 3))
+    word = rec.get("word")
+
+    days = rollup["days"]
+    if day not in days:
+        wk = day.isocalendar()[:2]
+        rollup["weeks"][wk] = rollup["weeks"].get(wk, 0) + 1
+
+    last = rollup["last"]
+    if last is None or day > last:
+        rollup["last"] = last = day
+    if day > last - timedelta(days=RECENT_DAYS):
+        days[day] = (level, word)
+    # keep only the recent window
+    for old_day in [k for k in days if k <= last - timedelta(days=RECENT_DAYS)]:
+        del days[old_day]
+
+
+def rollup_from_checkins(checkins: list[dict]) -> dict:
+    rollup = new_rollup()
+    for c in checkins:
+        add_checkin(rollup, c)
+    return rollup
+
+
+def week_count(rollup: dict, today: date | None = None) -> int:
+    today = today or date.today()
+    return rollup["weeks"].get(today.isocalendar()[:2], 0)
+
+
+def recent_stats(rollup: dict, today: date | None = None) -> dict:
+    """Same result as daily.mood_stats_7d, from at most 7 buckets."""
+    today = today or date.today()
+    cutoff = today - timedelta(days=RECENT_DAYS - 1)
+
+    level_sum = 0
+    count = 0
+    freq = {}
+    for day in sorted(rollup["days"]):
+        if day < cutoff:
+            continue
+        level, word = rollup["days"][day]
+        level_sum += level
+        count += 1
+        if word:
+            freq[word] = freq.get(word, 0) + 1
+
+    if not count:
+        return {"avg_level": None, "top_word": None}
+    top_word = max(freq, key=freq.get) if freq else None
+    return {"avg_level": level_sum / count, "top_word": top_word}
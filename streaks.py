@@ -0,0 +1,94 @@
+from collections import deque
+from datetime import date
+
+# ==============================
+# STREAK ENGINE
+# ==============================
+# A streak is a run of check-in days where the total number of missed days
+# inside the run is at most grace_days (0 = strict, 1 = gentle).
+#
+# For each grace level we keep a sliding window that ends at the latest
+# check-in and is as long as the grace budget allows:
+#   n      number of days pushed so far (day i has index i)
+#   last   ordinal of the latest day
+#   start  index of the first day in the window
+#   gaps   deque of (missed_days, index_of_day_after_gap) inside the window
+#   missed sum of missed_days in gaps
+#   best   longest window seen
+# Pushing a day is amortized O(1) and the deque never holds more than
+# grace_days + 1 entries, so reading the current streak is O(1) too.
+
+GRACE_LEVELS = (0, 1)
+
+
+def _new_run() -> dict:
+    return {"n": 0, "last": None, "start": 0, "gaps": deque(), "missed": 0, "best": 0}
+
+
+def new_streak_state(graces=GRACE_LEVELS) -> dict:
+    return {g: _new_run() for g in graces}
+
+
+def push_day(state: dict, day: date) -> None:
+    """
+    Add one check-in day. Days must arrive in order; pushing the latest day
+    again is a no-op (re-saving today's mood does not change the streak).
+    """
+    o = day.toordinal()
+    for g, run in state.items():
+        last = run["last"]
+        if last is not None and o <= last:
+            if o == last:
+                continue
+            raise ValueError("streak days must be pushed in date order")
+
+        idx = run["n"]
+        if last is not None and o - last > 1:
+            gap = o - last - 1
+            run["gaps"].append((gap, idx))
+            run["missed"] += gap
+            while run["missed"] > g:
+                dropped, after = run["gaps"].popleft()
+                run["missed"] -= dropped
+                run["start"] = after
+
+        run["n"] = idx + 1
+        run["last"] = o
+        run["best"] = max(run["best"], idx - run["start"] + 1)
+
+
+def read_streaks(state: dict, grace_days: int = 0, today: date | None = None) -> dict:
+    """Current + best streak for one tracked grace level, in O(1)."""
+    run = state[grace_days]
+    if run["last"] is None:
+        return {"current": 0, "best": 0}
+
+    today = today or date.today()
+    # days between the latest check-in and today count as misses
+    pending = max(0, today.toordinal() - run["last"])
+    budget = grace_days - pending
+    if budget < 0:
+        return {"current": 0, "best": run["best"]}
+
+    start = run["start"]
+    used = 0
+    for missed, after in reversed(run["gaps"]):
+        if used + missed > budget:
+            start = after
+            break
+        used += missed
+
+    return {"current": run["n"] - start, "best": run["best"]}
+
+
+def state_from_days(days, graces=GRACE_LEVELS) -> dict:
+    """Build a streak state from any iterable of dates (one sorted pass)."""
+    state = new_streak_state(graces)
+    for d in sorted(set(days)):
+        push_day(state, d)
+    return state
+
+
+def streaks_from_days(days, grace_days: int = 0, today: date | None = None) -> dict:
+    """One-off current/best streak for any grace level."""
+    return read_streaks(state_from_days(days, (grace_days,)), grace_days, today)
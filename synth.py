@@ -0,0 +1,280 @@
+import argparse
+import json
+import random
+import sys
+import time
+from collections import deque
+from datetime import date, timedelta
+from pathlib import Path
+
+from chatlog import SEGMENT_SIZE
+from daily import _shard_path
+from mood_logic import MOOD_GRID, mood_to_num
+from personas import ADJ, NOUN
+
+# ==============================
+# SYNTHETIC DATA AT PRODUCTION SIZE
+# ==============================
+# Seeded generator for load tests. It writes the files the app itself
+# reads, under one output directory laid out like the working directory:
+#
+#   wallets.json                  legacy wallet dict (load_wallets imports it)
+#   checkins/<user>.json          one shard per user (daily.load_checkins)
+#   chat_archive/<seq>.jsonl      chat segments (ChatLog)
+#   state/ops-000000000001.jsonl  board posts + replies as journal ops
+#
+#   python synth.py --scale 100k --out synth_data
+#   python synth.py --users 5000 --years 2 --only wallets checkins
+#
+# Everything is streamed: one wallet, one user's history, one message or
+# one board op at a time, so memory stays flat from 1k to 1M users. Each
+# user draws from their own seeded RNG, so a user's data is the same
+# whatever else is generated alongside it.
+
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+SEED = 7
+YEARS = 3                # check-in history window
+MEAN_ACTIVE_DAYS = 120   # users drift away after this long on average
+LEGACY_SHARE = 0.2       # wallets still in the old helper_score format
+CHAT_PER_USER = 2.0
+POSTS_PER_USER = 0.1
+REPLIES_PER_POST = 3.0
+RECENT_POSTS = 5_000     # replies go to one of the newest posts
+
+SECTIONS = ("wallets", "checkins", "chat", "board")
+
+_CHAT_LINES = [
+    "anyone else up?", "just checking in", "long day today", "that helps, thanks",
+    "breathing for a minute", "small win: I went outside", "same here", "sending good vibes",
+    "taking it slow", "hi everyone", "back again", "rough morning, better now",
+]
+_TOPICS = [
+    "sleep", "exams", "work stress", "loneliness", "motivation", "friends", "family",
+    "routine", "burnout", "moving", "focus", "anxiety", "exercise", "journaling",
+]
+_REPLY_LINES = [
+    "try a short walk first thing", "writing it down helped me", "you're not alone in this",
+    "small steps still count", "talk to someone you trust", "take a break, then try again",
+    "same thing happened to me", "a routine made it easier", "be kind to yourself",
+]
+
+
+def user_name(i: int) -> str:
+    # persona-style and unique: the index keeps a million of them apart
+    return f"{ADJ[i % len(ADJ)]}{NOUN[i // len(ADJ) % len(NOUN)]}{i}"
+
+
+def _rng(seed: int, section: str, i: int) -> random.Random:
+    return random.Random(f"{seed}/{section}/{i}")
+
+
+def _active_user(rng: random.Random, n_users: int) -> int:
+    # a few users do most of the talking
+    return int(n_users * rng.random() ** 3)
+
+
+# ---------- wallets ----------
+def wallet_entry(rng: random.Random, today: date) -> dict:
+    """One wallets.json value; some are in the pre-reputation format."""
+    w = {
+        "coins": 12 + int(rng.expovariate(1 / 30)),
+        "trophies": int(rng.paretovariate(1.5)) * 10 - 10 if rng.random() < 0.4 else 0,
+        "last_award_date": (today - timedelta(days=int(rng.expovariate(1 / 20)))).isoformat() if rng.random() < 0.7 else None,
+    }
+    if rng.random() < LEGACY_SHARE:
+        w["helper_score"] = int(rng.paretovariate(1.2)) - 1
+        del w["trophies"]  # older records predate trophies too
+    else:
+        w["reputation"] = int(rng.paretovariate(1.2)) - 1
+    return w
+
+
+def iter_wallets(n_users: int, seed: int = SEED, today: date | None = None):
+    """(user, wallet) pairs in user order."""
+    today = today or date.today()
+    for i in range(n_users):
+        yield user_name(i), wallet_entry(_rng(seed, "wallet", i), today)
+
+
+# ---------- check-ins ----------
+def _checkin(rng: random.Random, day: date, row: int) -> dict:
+    # one record as the home page saves it (the word is stored as the mode too)
+    if rng.random() >= 0.5:
+        row = rng.randrange(len(MOOD_GRID))
+    word = rng.choice(MOOD_GRID[row])
+    return {"date": day.isoformat(), "word": word, "mode": word, "level": mood_to_num(word)}
+
+
+def history(rng: random.Random, n_records: int, end: date, skip: float = 0.15) -> list[dict]:
+    """Exactly n_records check-ins ending on `end` (oldest first), skipping ~skip of days."""
+    row = rng.randrange(len(MOOD_GRID))
+    out = []
+    day = end
+    while len(out) < n_records:
+        if not out or rng.random() >= skip:
+            out.append(_checkin(rng, day, row))
+        day -= timedelta(days=1)
+    out.reverse()
+    return out
+
+
+def user_history(rng: random.Random, end: date, years: int = YEARS) -> list[dict]:
+    """
+    One user's check-ins: joined some time in the last `years`, active for
+    a while, with streaks (checking in yesterday makes today likelier).
+    """
+    joined = end - timedelta(days=rng.randrange(years * 365))
+    stop = min(end, joined + timedelta(days=int(rng.expovariate(1 / MEAN_ACTIVE_DAYS))))
+    keep, come_back = rng.uniform(0.5, 0.95), rng.uniform(0.05, 0.4)
+    row = rng.randrange(len(MOOD_GRID))  # their usual mood
+    out = []
+    on = True
+    for o in range(joined.toordinal(), stop.toordinal() + 1):
+        on = rng.random() < (keep if on else come_back)
+        if on:
+            out.append(_checkin(rng, date.fromordinal(o), row))
+    return out
+
+
+def iter_checkins(n_users: int, seed: int = SEED, years: int = YEARS, end: date | None = None):
+    """(user, check-ins) pairs; users with no check-ins are skipped."""
+    end = end or date.today()
+    for i in range(n_users):
+        checkins = user_history(_rng(seed, "checkins", i), end, years)
+        if checkins:
+            yield user_name(i), checkins
+
+
+# ---------- chat ----------
+def iter_chat(n_messages: int, n_users: int, seed: int = SEED, days: int = 30, end: float | None = None):
+    """Chat messages in time order, with their seq (ChatLog records)."""
+    rng = random.Random(f"{seed}/chat")
+    end = time.time() if end is None else end
+    t = end - days * 86400
+    step = days * 86400 / max(1, n_messages)
+    for seq in range(n_messages):
+        t += rng.expovariate(1 / step)
+        yield {"u": user_name(_active_user(rng, n_users)), "t": rng.choice(_CHAT_LINES), "time": min(t, end), "seq": seq}
+
+
+# ---------- board ----------
+def iter_board_ops(n_posts: int, n_users: int, seed: int = SEED, days: int = 90, end: float | None = None):
+    """
+    Board journal ops ({"op": "post"/"reply", ..., "lsn"}) in time order.
+    Replies pick one of the RECENT_POSTS newest posts, newer ones more often.
+    """
+    rng = random.Random(f"{seed}/board")
+    end = time.time() if end is None else end
+    n_events = int(n_posts * (1 + REPLIES_PER_POST))
+    t = end - days * 86400
+    step = days * 86400 / max(1, n_events)
+    recent = deque(maxlen=RECENT_POSTS)
+    posts = lsn = 0
+    while posts < n_posts or (recent and lsn < n_events):
+        t += rng.expovariate(1 / step)
+        stamp = min(t, end)
+        lsn += 1
+        author = user_name(_active_user(rng, n_users))
+        if posts < n_posts and (not recent or rng.random() < 1 / (1 + REPLIES_PER_POST)):
+            topic = rng.choice(_TOPICS)
+            post = {
+                "id": f"p_{int(stamp * 1000)}_{rng.randint(1000, 9999)}",
+                "title": f"Advice on {topic}?",
+                "body": f"Lately {topic} has been hard. {rng.choice(_CHAT_LINES).capitalize()}. Any tips?",
+                "author": None if rng.random() < 0.5 else author,  # half post anonymously
+                "time": stamp,
+            }
+            recent.append(post["id"])
+            posts += 1
+            yield {"op": "post", "post": post, "lsn": lsn}
+        else:
+            target = recent[len(recent) - 1 - int(len(recent) * rng.random() ** 2)]
+            reply = {
+                "id": f"r_{int(stamp * 1000)}_{rng.randint(1000, 9999)}",
+                "text": rng.choice(_REPLY_LINES),
+                "author": author,
+                "time": stamp,
+            }
+            yield {"op": "reply", "post_id": target, "reply": reply, "lsn": lsn}
+
+
+# ---------- writers ----------
+def write_wallets(out: Path, n_users: int, seed: int = SEED) -> int:
+    # one JSON object, written entry by entry
+    with (out / "wallets.json").open("w", encoding="utf-8") as f:
+        f.write("{\n")
+        for k, (user, w) in enumerate(iter_wallets(n_users, seed)):
+            f.write(("," if k else " ") + json.dumps(user) + ": " + json.dumps(w) + "\n")
+        f.write("}\n")
+    return n_users
+
+
+def write_checkins(out: Path, n_users: int, seed: int = SEED, years: int = YEARS) -> int:
+    (out / "checkins").mkdir(parents=True, exist_ok=True)
+    records = 0
+    for user, checkins in iter_checkins(n_users, seed, years):
+        # same layout as daily.save_checkins
+        (out / _shard_path(user)).write_text(json.dumps(checkins, ensure_ascii=False, indent=2), encoding="utf-8")
+        records += len(checkins)
+    return records
+
+
+def write_chat(out: Path, n_messages: int, n_users: int, seed: int = SEED) -> int:
+    folder = out / "chat_archive"
+    folder.mkdir(parents=True, exist_ok=True)
+    f = None
+    try:
+        for m in iter_chat(n_messages, n_users, seed):
+            if m["seq"] % SEGMENT_SIZE == 0:
+                if f is not None:
+                    f.close()
+                f = (folder / f"{m['seq']:012d}.jsonl").open("w", encoding="utf-8")
+            f.write(json.dumps(m, ensure_ascii=False) + "\n")
+    finally:
+        if f is not None:
+            f.close()
+    return n_messages
+
+
+def write_board(out: Path, n_posts: int, n_users: int, seed: int = SEED) -> int:
+    # a single op-log segment; Journal.load replays it on startup
+    (out / "state").mkdir(parents=True, exist_ok=True)
+    n = 0
+    with (out / "state" / f"ops-{1:012d}.jsonl").open("w", encoding="utf-8") as f:
+        for op in iter_board_ops(n_posts, n_users, seed):
+            f.write(json.dumps(op, ensure_ascii=False) + "\n")
+            n += 1
+    return n
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Write seeded synthetic app data in the app's own formats.")
+    size = ap.add_mutually_exclusive_group()
+    size.add_argument("--scale", choices=SCALES, default="1k")
+    size.add_argument("--users", type=int, help="exact user count (instead of --scale)")
+    ap.add_argument("--out", type=Path, default=Path("synth_data"))
+    ap.add_argument("--seed", type=int, default=SEED)
+    ap.add_argument("--years", type=int, default=YEARS, help="check-in history window")
+    ap.add_argument("--only", nargs="+", choices=SECTIONS, default=list(SECTIONS))
+    args = ap.parse_args(argv)
+
+    n_users = args.users or SCALES[args.scale]
+    out = args.out
+    out.mkdir(parents=True, exist_ok=True)
+    jobs = {
+        "wallets": lambda: (write_wallets(out, n_users, args.seed), "wallets"),
+        "checkins": lambda: (write_checkins(out, n_users, args.seed, args.years), "check-ins"),
+        "chat": lambda: (write_chat(out, int(n_users * CHAT_PER_USER), n_users, args.seed), "messages"),
+        "board": lambda: (write_board(out, int(n_users * POSTS_PER_USER), n_users, args.seed), "board ops"),
+    }
+    for name in SECTIONS:
+        if name in args.only:
+            t0 = time.perf_counter()
+            n, what = jobs[name]()
+            print(f"{name:9} {n:>12,} {what:10} {time.perf_counter() - t0:8.1f}s")
+    print(f"wrote {out}/ for {n_users:,} users (seed {args.seed})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+from datetime import date, timedelta
+
+from daily import heat_index_from_checkins, history_frames
+
+
+def _checkins(n: int, end: date) -> list[dict]:
+    return [{"date": (end - timedelta(days=i)).isoformat(), "level": 3} for i in range(n)]
+
+
+def test_tiers_cover_every_day():
+    # ends on various weekdays / month positions so the tier boundaries move around
+    for end in (date(2025, 3, 1), date(2025, 6, 18), date(2025, 12, 31), date(2026, 2, 9)):
+        checkins = _checkins(900, end)
+        frames = history_frames(heat_index_from_checkins(checkins), end)
+
+        covered = set(frames["daily"]["date"])
+        for start in frames["weekly"]["start"]:
+            first = date.fromisoformat(start)
+            covered.update((first + timedelta(days=i)).isoformat() for i in range(7))
+        months = set(zip(frames["monthly"]["year"], frames["monthly"]["month"]))
+
+        missing = []
+        for c in checkins:
+            day = date.fromisoformat(c["date"])
+            if c["date"] not in covered and (day.year, day.month - 1) not in months:
+                missing.append(c["date"])
+        assert missing == []
@@ -0,0 +1,24 @@
+import json
+
+from wallet import WalletLedger
+
+
+def test_bad_legacy_records_are_skipped_one_by_one(tmp_path):
+    legacy = json.loads("""{
+        "good":     {"coins": 40, "helper_score": 3},
+        "inf":      {"coins": Infinity},
+        "nan":      {"coins": 5, "trophies": NaN},
+        "text":     {"coins": "lots"},
+        "huge":     {"coins": 99999999999999999999},
+        "not_dict": 5,
+        "date":     {"coins": 1, "last_award_date": {"x": 1}},
+        "numeric":  {"coins": "7", "reputation": 2.0}
+    }""")
+    ledger = WalletLedger(tmp_path / "w.db")
+    assert ledger.import_legacy(legacy) == 6
+
+    rows = ledger.snapshot()
+    assert set(rows) == {"good", "numeric"}
+    assert rows["good"]["coins"] == 40 and rows["good"]["reputation"] == 3
+    assert rows["numeric"]["coins"] == 7 and rows["numeric"]["reputation"] == 2
+    ledger.close()
@@ -2,44 +2,314 @@
 from __future__ import annotations
 from pathlib import Path
 import json
-from datetime import date, timedelta
+import logging
+import math
+import sqlite3
+import threading
+import time
+from types import MappingProxyType
+from datetime import date
 
-WALLET_PATH = Path("wallets.json")
+from profiler import timed
+from streaks import read_streaks, streaks_from_days
 
-def load_wallets() -> dict:
-    if WALLET_PATH.exists():
-        try:
-            return json.loads(WALLET_PATH.read_text())
-        except Exception:
-            return {}
-    return {}
+WALLET_PATH = Path("wallets.json")  # legacy store, imported once into the ledger
+LEDGER_PATH = Path("wallets.db")
 
-def save_wallets(wallets: dict) -> None:
-    WALLET_PATH.write_text(json.dumps(wallets, indent=2))
+log = logging.getLogger(__name__)
 
-def get_user_wallet(wallets: dict, user: str) -> dict:
-    w = wallets.setdefault(
-        user,
-        {
-            "coins": 12,
-            "reputation": 0,
-            "last_award_date": None,
-        },
-    )
+START_COINS = 12
+EXTERNAL_CHECK_SECONDS = 1.0  # how often to look for writes from other processes
 
-    # ---- MIGRATION SUPPORT ----
-    # convert old helper_score -> reputation
-    if "reputation" not in w:
-        w["reputation"] = int(w.get("helper_score", 0))
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS wallets (
+    user            TEXT PRIMARY KEY,
+    coins           INTEGER NOT NULL DEFAULT 12,
+    reputation      INTEGER NOT NULL DEFAULT 0,
+    trophies        INTEGER NOT NULL DEFAULT 0,
+    last_award_date TEXT
+);
+CREATE TABLE IF NOT EXISTS wallet_tx (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    user       TEXT NOT NULL,
+    kind       TEXT NOT NULL,
+    coins      INTEGER NOT NULL DEFAULT 0,
+    reputation INTEGER NOT NULL DEFAULT 0,
+    trophies   INTEGER NOT NULL DEFAULT 0,
+    time       REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS wallet_tx_user ON wallet_tx(user, id);
+"""
 
-    # ensure coins exists
-    if "coins" not in w:
-        w["coins"] = 12
 
-    if "last_award_date" not in w:
-        w["last_award_date"] = None
+def _legacy_int(value) -> int:
+    # wallets.json balances: ints, numeric strings or finite floats. json.loads
+    # accepts Infinity/NaN, and SQLite only stores 64-bit ints
+    if isinstance(value, str):
+        value = int(value)
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            raise ValueError(f"not a finite number: {value!r}")
+        value = int(value)
+    if not isinstance(value, int):
+        raise TypeError(f"not a number: {value!r}")
+    if abs(value) >= 2**63:
+        raise ValueError(f"out of range: {value!r}")
+    return value
 
-    return w
+
+class WalletLedger:
+    """
+    SQLite-backed wallet store.
+    Every balance change is one transaction: a single-row UPDATE plus one
+    append to wallet_tx, so write cost does not grow with the user count.
+
+    One ledger is shared by every session in the process. Reads come from a
+    row cache of read-only views; a write swaps in a fresh view for that one
+    user (copy-on-write), so other sessions see it on their next rerun
+    without touching the file.
+    """
+
+    def __init__(self, path: Path = LEDGER_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()  # one connection shared by session threads
+        self._conn = sqlite3.connect(
+            str(self.path),
+            timeout=10,
+            isolation_level=None,  # we issue BEGIN/COMMIT ourselves
+            check_same_thread=False,
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+        self._rows: dict[str, MappingProxyType] = {}
+        self._listeners = []  # fn(user, view) after each committed change
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        self._tx_seen = self._conn.execute("SELECT COALESCE(MAX(id), 0) FROM wallet_tx").fetchone()[0]
+        self._checked_at = time.monotonic()
+
+    # ---------- reads ----------
+    def _read_row(self, user: str) -> MappingProxyType:
+        # caller holds self._lock
+        row = self._conn.execute(
+            "SELECT coins, reputation, trophies, last_award_date FROM wallets WHERE user = ?",
+            (user,),
+        ).fetchone()
+        if row is None:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO wallets(user, coins) VALUES (?, ?)",
+                (user, START_COINS),
+            )
+            view = MappingProxyType(
+                {"coins": START_COINS, "reputation": 0, "trophies": 0, "last_award_date": None}
+            )
+        else:
+            view = MappingProxyType(dict(row))
+        self._rows[user] = view
+        return view
+
+    def _drop_stale_cache(self) -> list[tuple[str, MappingProxyType]]:
+        """
+        Caller holds self._lock. data_version only moves on other
+        connections' commits; then the cache is dropped and the users those
+        commits touched (from wallet_tx) are returned with fresh views, for
+        the caller to pass to listeners once the lock is released.
+        """
+        now = time.monotonic()
+        if now - self._checked_at < EXTERNAL_CHECK_SECONDS:
+            return []
+        self._checked_at = now
+        dv = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if dv == self._data_version:
+            return []
+        self._data_version = dv
+        self._rows.clear()
+        rows = self._conn.execute(
+            "SELECT user, MAX(id) FROM wallet_tx WHERE id > ? GROUP BY user", (self._tx_seen,)
+        ).fetchall()
+        self._tx_seen = max([self._tx_seen] + [r[1] for r in rows])
+        # may include this process's own recent writes; listeners are idempotent
+        return [(r[0], self._read_row(r[0])) for r in rows] if self._listeners else []
+
+    def _notify(self, changed) -> None:
+        # outside the lock, so listeners may read the ledger themselves
+        for user, view in changed:
+            for fn in self._listeners:
+                fn(user, view)
+
+    def wallet(self, user: str) -> MappingProxyType:
+        """Read-only view of one wallet (creates it with starting coins)."""
+        with self._lock:
+            changed = self._drop_stale_cache()
+            view = self._rows.get(user)
+            if view is None:
+                view = self._read_row(user)
+        if changed:
+            self._notify(changed)
+        return view
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user, coins, reputation, trophies, last_award_date FROM wallets"
+            ).fetchall()
+        return {r["user"]: {k: r[k] for k in r.keys() if k != "user"} for r in rows}
+
+    def history(self, user: str, limit: int = 50) -> list[dict]:
+        """Newest-first transaction history for one user."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, coins, reputation, trophies, time FROM wallet_tx "
+                "WHERE user = ? ORDER BY id DESC LIMIT ?",
+                (user, limit),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM wallets").fetchone()[0]
+
+    # ---------- writes ----------
+    def subscribe(self, fn) -> None:
+        """
+        Call fn(user, new_view) after every change this process commits, and
+        for users other processes changed once their commits are noticed.
+        """
+        if fn not in self._listeners:
+            self._listeners.append(fn)
+
+    def apply(
+        self,
+        user: str,
+        kind: str,
+        coins: int = 0,
+        reputation: int = 0,
+        trophies: int = 0,
+        min_coins: int = 0,
+        award_date: str | None = None,
+    ) -> bool:
+        """
+        Atomically change one user's balances and record the change.
+        The update is skipped (returns False) if the user has fewer than
+        min_coins, or if award_date is given and was already awarded.
+        Trophies never go below 0.
+        """
+        sql = (
+            "UPDATE wallets SET coins = coins + :coins, "
+            "reputation = reputation + :rep, "
+            "trophies = MAX(0, trophies + :tro), "
+            "last_award_date = COALESCE(:award, last_award_date) "
+            "WHERE user = :user AND coins >= :min_coins"
+        )
+        if award_date is not None:
+            sql += " AND (last_award_date IS NULL OR last_award_date != :award)"
+        params = {
+            "user": user,
+            "coins": int(coins),
+            "rep": int(reputation),
+            "tro": int(trophies),
+            "award": award_date,
+            "min_coins": int(min_coins),
+        }
+
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR IGNORE INTO wallets(user, coins) VALUES (?, ?)",
+                    (user, START_COINS),
+                )
+                changed = conn.execute(sql, params).rowcount == 1
+                if changed:
+                    conn.execute(
+                        "INSERT INTO wallet_tx(user, kind, coins, reputation, trophies, time) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (user, kind, params["coins"], params["rep"], params["tro"], time.time()),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                self._rows.pop(user, None)
+                raise
+            if changed:
+                view = self._read_row(user)
+        if changed:
+            self._notify([(user, view)])
+        return changed
+
+    def import_legacy(self, wallets: dict) -> int:
+        """
+        Bulk-load a wallets.json dict (one transaction, existing rows win).
+        A malformed record is logged and skipped on its own, so it can't cost
+        everyone else their coins. Returns how many were skipped.
+        """
+        rows = []
+        skipped = 0
+        for user, w in wallets.items():
+            try:
+                if not isinstance(w, dict):
+                    raise TypeError(f"expected an object, got {type(w).__name__}")
+                # ---- MIGRATION SUPPORT ----
+                # convert old helper_score -> reputation
+                rep = w.get("reputation", w.get("helper_score", 0))
+                award = w.get("last_award_date")
+                if award is not None and not isinstance(award, str):
+                    raise TypeError(f"last_award_date {award!r}")
+                rows.append((
+                    user,
+                    _legacy_int(w.get("coins", START_COINS)),
+                    _legacy_int(rep or 0),
+                    _legacy_int(w.get("trophies", 0) or 0),
+                    award,
+                ))
+            except (TypeError, ValueError, OverflowError) as e:
+                skipped += 1
+                log.warning("legacy wallet for %r skipped: %s", user, e)
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO wallets(user, coins, reputation, trophies, last_award_date) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self._rows.clear()
+        return skipped
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+@timed("load_wallets")
+def load_wallets(path: Path = LEDGER_PATH) -> WalletLedger:
+    ledger = WalletLedger(path)
+
+    # first run: pull in the old wallets.json so nobody loses coins. Bad
+    # records are skipped one by one; an unreadable file is an error, since
+    # once rows exist the import never runs again
+    if len(ledger) == 0 and WALLET_PATH.exists():
+        ledger.import_legacy(json.loads(WALLET_PATH.read_text()))
+    return ledger
+
+@timed("save_wallets")
+def save_wallets(wallets: WalletLedger, path: Path = WALLET_PATH) -> None:
+    """
+    Ledger operations commit on their own; this only exports a JSON
+    snapshot in the old wallets.json format (backups / debugging).
+    """
+    path.write_text(json.dumps(wallets.snapshot(), indent=2))
+
+def get_user_wallet(wallets: WalletLedger, user: str) -> MappingProxyType:
+    return wallets.wallet(user)
 
 
 
@@ -51,35 +321,33 @@ def coins_for_streak(streak_len: int) -> int:
         return 2
     return 1
 
-def streak_ending_today(checkins: list) -> int:
+def streak_ending_today(checkins: list, streak_state: dict | None = None) -> int:
     """
     Compute streak length ending today based on checkins that contain a 'date' field 'YYYY-MM-DD'
     OR contain a 'timestamp' field (fallback).
+    If a streak state from daily.build_checkin_stats is given, it is read in O(1) instead.
     """
+    if streak_state is not None and 0 in streak_state:
+        return read_streaks(streak_state, 0)["current"]
+
     # Prefer explicit 'date' keys if your daily.py uses them
     dates = set()
     for c in checkins or []:
         if isinstance(c, dict):
             if "date" in c and c["date"]:
-                dates.add(c["date"])
+                dates.add(date.fromisoformat(c["date"]))
             elif "timestamp" in c and c["timestamp"]:
-                # fallback: convert timestamp -> date string
+                # fallback: convert timestamp -> date
                 from datetime import datetime
-                d = datetime.fromtimestamp(c["timestamp"]).date().isoformat()
-                dates.add(d)
+                dates.add(datetime.fromtimestamp(c["timestamp"]).date())
 
     if not dates:
         return 0
+    return streaks_from_days(dates, 0)["current"]
 
-    today = date.today()
-    streak = 0
-    cur = today
-    while cur.isoformat() in dates:
-        streak += 1
-        cur = cur - timedelta(days=1)
-    return streak
-
-def maybe_award_daily_coins(wallets: dict, user: str, checkins: list) -> int:
+def maybe_award_daily_coins(
+    wallets: WalletLedger, user: str, checkins: list, streak_state: dict | None = None
+) -> int:
     """
     Award coins once per day per user. Returns coins awarded (0 if none).
     Uses streak length after today's check-in exists.
@@ -87,31 +355,25 @@ def maybe_award_daily_coins(wallets: dict, user: str, checkins: list) -> int:
     w = get_user_wallet(wallets, user)
     today_str = date.today().isoformat()
 
-    # prevent double-award in the same day
+    # prevent double-award in the same day (re-checked inside the transaction)
     if w.get("last_award_date") == today_str:
         return 0
 
-    streak_len = streak_ending_today(checkins)
+    streak_len = streak_ending_today(checkins, streak_state)
     if streak_len <= 0:
         return 0
 
     earned = coins_for_streak(streak_len)
-    w["coins"] = int(w.get("coins", 0)) + earned
-    w["last_award_date"] = today_str
+    if not wallets.apply(user, "daily_award", coins=earned, award_date=today_str):
+        return 0
     return earned
 
-def can_spend(wallets: dict, user: str, cost: int) -> bool:
-    w = get_user_wallet(wallets, user)
-    return int(w.get("coins", 0)) >= cost
+def spend(wallets: WalletLedger, user: str, cost: int) -> bool:
+    return wallets.apply(user, "spend", coins=-int(cost), min_coins=int(cost))
 
-def spend(wallets: dict, user: str, cost: int) -> bool:
-    w = get_user_wallet(wallets, user)
-    coins = int(w.get("coins", 0))
-    if coins < cost:
-        return False
-    w["coins"] = coins - cost
-    return True
+def add_reputation(wallets: WalletLedger, user: str, points: int) -> None:
+    wallets.apply(user, "reputation", reputation=points)
 
-def add_reputation(wallets: dict, user: str, points: int) -> None:
-    w = get_user_wallet(wallets, user)
-    w["reputation"] = int(w.get("reputation", 0)) + int(points)
+def add_trophies(wallets: WalletLedger, user: str, points: int) -> None:
+    # clamps at 0 inside the ledger
+    wallets.apply(user, "trophies", trophies=points)